@@ -0,0 +1,92 @@
+'''
+Report bytes per node of the object AST against the
+struct-of-arrays ASTArena, and time evaluation over both
+
+usage: python benchmarks/bench_arena.py [statements]
+
+Author: GotoCode
+'''
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eval_pascal
+import pascal_arena
+from eval_pascal import Interpreter, Token
+
+from bench_engines import make_source
+
+
+def object_bytes(ast):
+    '''
+    RETURN: (nodes, bytes) held by an object AST, counting
+            each node, its __dict__, children lists, tokens
+            and token values once
+    '''
+    seen  = set()
+    total = 0
+    nodes = 0
+    stack = [ast]
+    
+    def add(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+    
+    while stack:
+        node   = stack.pop()
+        nodes += 1
+        total += add(node) + add(node.__dict__)
+        for value in node.__dict__.values():
+            if isinstance(value, Token):
+                total += add(value) + add(value.value)
+            elif isinstance(value, list):
+                total += add(value)
+                stack.extend(value)
+            elif hasattr(value, '__dict__'):
+                stack.append(value)
+            else:
+                total += add(value)
+    
+    return nodes, total
+
+def timed(func, arg):
+    
+    gc.disable()
+    start = time.time()
+    func(arg)
+    elapsed = time.time() - start
+    gc.enable()
+    
+    return elapsed
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ast        = Interpreter(make_source(statements)).program()
+    arena      = pascal_arena.build_arena(ast)
+    
+    nodes, before = object_bytes(ast)
+    after = arena.nbytes()
+    
+    print '%d statements' % statements
+    print 'object AST : %7d nodes %11d bytes %7.1f bytes/node' % (nodes, before, float(before) / nodes)
+    print 'ASTArena   : %7d nodes %11d bytes %7.1f bytes/node' % (len(arena), after, float(after) / len(arena))
+    
+    def walk(tree):
+        eval_pascal.GLOBAL_SCOPE.clear()
+        eval_pascal.eval_AST(tree)
+    
+    print 'eval_AST   : %.3fs' % timed(walk, ast)
+    print 'eval_arena : %.3fs' % timed(pascal_arena.eval_arena, arena)
+    print 'same result: %s' % (pascal_arena.run(arena) == eval_pascal.GLOBAL_SCOPE)
+
+
+if __name__ == '__main__':
+    main()
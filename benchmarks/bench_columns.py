@@ -0,0 +1,71 @@
+'''
+Compare per-token memory of a list of Token objects with
+the columnar TokenColumns stream of eval_pascal, and check
+that the parser gives the same result off both
+
+usage: python benchmarks/bench_columns.py [statements]
+
+Author: GotoCode
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eval_pascal
+from eval_pascal import Interpreter, TokenColumns, EOF, REGEX_LEXER, COLUMNAR_LEXER
+
+
+def make_source(statements):
+    
+    body = ';\n'.join('    v%d := (v%d + %d) * 3 div 2' % (i, max(i - 1, 0), i) for i in range(statements))
+    
+    return 'BEGIN\n    v0 := 1;\n' + body + '\nEND.'
+
+def token_list_bytes(text):
+    '''
+    Bytes held by a fully materialised list of tokens
+    '''
+    interpreter = Interpreter(text, lexer=REGEX_LEXER)
+    tokens = [interpreter.curr_token]
+    
+    while tokens[-1].type != EOF:
+        tokens.append(interpreter.get_next_token())
+    
+    # count each distinct object once (fixed tokens are shared)
+    seen  = set()
+    total = sys.getsizeof(tokens)
+    
+    for token in tokens:
+        for obj in (token, token.value):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += sys.getsizeof(obj)
+    
+    return len(tokens), total
+
+def run(text, lexer):
+    
+    eval_pascal.GLOBAL_SCOPE.clear()
+    Interpreter(text, lexer=lexer).eval()
+    
+    return dict(eval_pascal.GLOBAL_SCOPE)
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text = make_source(statements)
+    
+    count, list_bytes = token_list_bytes(text)
+    columns = TokenColumns(text)
+    
+    print 'tokens          : %d' % count
+    print 'Token list      : %10d bytes (%6.1f bytes/token)' % (list_bytes, float(list_bytes) / count)
+    print 'TokenColumns    : %10d bytes (%6.1f bytes/token)' % (columns.nbytes(), float(columns.nbytes()) / len(columns))
+    print 'same result     : %s' % (run(text, REGEX_LEXER) == run(text, COLUMNAR_LEXER))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Compare the recursive eval_AST with the work-stack
+eval_iterative on a long left-deep chain (1 + 1 + ... + 1)
+
+The recursive walker only survives 100k terms when run in
+a thread with a large stack and a raised recursion limit
+
+usage: python benchmarks/bench_deep.py [terms]
+
+Author: GotoCode
+'''
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc6
+import eval_pascal
+
+
+def timed(func, arg):
+    
+    start  = time.time()
+    result = func(arg)
+    
+    return result, time.time() - start
+
+def in_big_stack(func, arg):
+    '''
+    Run func(arg) in a thread with room for deep recursion
+    '''
+    out = {}
+    
+    def target():
+        try:
+            out['result'] = timed(func, arg)
+        except RuntimeError as e:
+            out['error'] = e
+    
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(10 ** 7)
+    threading.stack_size(512 * 1024 * 1024)
+    
+    try:
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+    finally:
+        threading.stack_size(0)
+        sys.setrecursionlimit(old_limit)
+    
+    if 'error' in out:
+        raise out['error']
+    
+    return out['result']
+
+
+def main():
+    
+    terms = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    chain = ' + '.join(['1'] * terms)
+    
+    cases = [('calc6', calc6, calc6.Interpreter(chain).expr()),
+             ('eval_pascal', eval_pascal, eval_pascal.Interpreter(chain).expr())]
+    
+    print '%d-term chain' % terms
+    
+    for name, module, ast in cases:
+        
+        try:
+            module.eval_AST(ast)
+            print '%-12s eval_AST fits the default recursion limit' % name
+        except RuntimeError:
+            print '%-12s eval_AST hits RecursionError at the default limit' % name
+        
+        expected, recursive = in_big_stack(module.eval_AST, ast)
+        result, iterative   = timed(module.eval_iterative, ast)
+        
+        print '%-12s recursive %.3fs  iterative %.3fs  speedup %.2fx  %s' % (
+            name, recursive, iterative, recursive / iterative, 'ok' if result == expected else 'MISMATCH')
+
+
+if __name__ == '__main__':
+    main()
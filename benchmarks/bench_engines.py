@@ -0,0 +1,91 @@
+'''
+Benchmark the eval_pascal execution engines on the same
+parsed program, re-running it several times
+
+usage: python benchmarks/bench_engines.py [statements] [runs]
+
+Author: GotoCode
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eval_pascal
+import pascal_vm
+from eval_pascal import Interpreter
+
+
+def make_source(statements):
+    
+    body = ';\n'.join('    v%d := (v%d + %d) * 3 div 2 - -v0' % (i, max(i - 1, 0), i) for i in range(1, statements))
+    
+    return 'BEGIN\n    v0 := 1;\n' + body + '\nEND.'
+
+def tree_walker(text):
+    
+    ast = Interpreter(text).program()
+    
+    def run():
+        eval_pascal.GLOBAL_SCOPE.clear()
+        eval_pascal.eval_AST(ast)
+        return dict(eval_pascal.GLOBAL_SCOPE)
+    
+    return run
+
+def slot_walker(text):
+    
+    ast     = Interpreter(text).program()
+    symbols = eval_pascal.resolve_slots(ast)
+    
+    def run():
+        slots = symbols.new_slots()
+        eval_pascal.eval_slots(ast, slots)
+        return symbols.export(slots)
+    
+    return run
+
+def closures(text):
+    
+    return Interpreter(text).compile().run
+
+def bytecode(text):
+    
+    program = pascal_vm.compile_program(Interpreter(text).program())
+    
+    return lambda: pascal_vm.run(program)
+
+
+ENGINES = [('eval_AST', tree_walker),
+           ('eval_slots', slot_walker),
+           ('closures', closures),
+           ('vm', bytecode)]
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    runs       = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    text       = make_source(statements)
+    expected   = None
+    
+    print '%d statements, %d runs each' % (statements, runs)
+    
+    for name, build in ENGINES:
+        run   = build(text)
+        start = time.time()
+        for _ in range(runs):
+            result = run()
+        elapsed = time.time() - start
+        
+        if expected is None:
+            expected = result
+        
+        print '%-12s %8.3fs  %10.0f statements/s  %s' % (name, elapsed, statements * runs / elapsed,
+                                                         'ok' if result == expected else 'MISMATCH')
+
+
+if __name__ == '__main__':
+    main()
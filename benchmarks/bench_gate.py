@@ -0,0 +1,335 @@
+'''
+Performance regression gate built on bench_suite
+
+'save' runs the suite and stores the results as a baseline;
+'check' reruns it with the same engines, workloads and sizes
+and exits non-zero when a phase has become significantly
+slower or uses significantly more memory; -e and -w narrow a
+check to part of the baseline
+
+For eval_pascal the three phases are Interpreter.get_next_token
+(lex), Interpreter.program (parse) and eval_AST (eval), so a
+slowdown can be traced to one of them
+
+A phase is flagged when both hold:
+
+    its median time grew by more than the threshold
+    a one-sided Mann-Whitney U test over the individual runs
+    gives p < alpha
+
+Peak memory is flagged when it grew by more than the memory
+threshold and by at least MEMORY_SLACK_KB
+
+usage: python benchmarks/bench_gate.py save BASELINE [--quick | --full]
+                                       [-r REPEATS] [-e ENGINE,...] [-w WORKLOAD,...]
+       python benchmarks/bench_gate.py check BASELINE [-r REPEATS]
+                                       [-e ENGINE,...] [-w WORKLOAD,...]
+                                       [-t THRESHOLD] [-m MEMORY_THRESHOLD]
+                                       [-a ALPHA] [--current FILE] [-o FILE]
+
+Author: GotoCode
+'''
+
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_suite
+from bench_suite import ENGINES, WORKLOADS, LEX, PARSE, EVAL, run_suite, log_record
+
+
+# gate sizes: big enough for stable timings, small enough to run often
+GATE_SIZES = {bench_suite.SHORT   : [2000],
+              bench_suite.CHAIN   : [5000],
+              bench_suite.NESTED  : [300],
+              bench_suite.PROGRAM : [5000],
+              bench_suite.RANDOM  : [5000]}
+
+DEFAULT_REPEATS          = 7
+DEFAULT_THRESHOLD        = 0.20
+DEFAULT_MEMORY_THRESHOLD = 0.20
+DEFAULT_ALPHA            = 0.05
+
+# peak RSS is sampled in pages; ignore growth below this
+MEMORY_SLACK_KB = 1024
+
+# exit status when a regression is found
+REGRESSION_STATUS = 1
+
+# function that each eval_pascal phase times
+PHASE_FUNCTIONS = {LEX   : 'Interpreter.get_next_token',
+                   PARSE : 'Interpreter.program',
+                   EVAL  : 'eval_AST'}
+
+
+# Statistics #
+
+def median(values):
+
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def relative_spread(values):
+    '''
+    Median absolute deviation, scaled to a standard deviation
+    and expressed as a fraction of the median
+    '''
+    centre = median(values)
+
+    if not centre:
+        return 0.0
+
+    return 1.4826 * median([abs(value - centre) for value in values]) / centre
+
+def mann_whitney_p(baseline, current):
+    '''
+    One-sided Mann-Whitney U test (normal approximation with
+    tie and continuity corrections)
+
+    RETURN: p-value for "current runs are slower than baseline"
+    '''
+    n, m = len(baseline), len(current)
+
+    if not n or not m:
+        return 1.0
+
+    u = 0.0
+    for c in current:
+        for b in baseline:
+            if c > b:
+                u += 1
+            elif c == b:
+                u += 0.5
+
+    # tie correction for the variance
+    counts = {}
+    for value in baseline + current:
+        counts[value] = counts.get(value, 0) + 1
+    total = n + m
+    ties  = sum(t ** 3 - t for t in counts.itervalues())
+    variance = n * m / 12.0 * ((total + 1) - ties / float(total * (total - 1)))
+
+    if variance <= 0:
+        return 1.0
+
+    z = (u - n * m / 2.0 - 0.5) / math.sqrt(variance)
+
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+# Comparison #
+
+def result_key(record):
+
+    return (record['engine'], record['workload'], record['size'], record['phase'])
+
+def phase_label(record):
+
+    if record['engine'] == 'eval_pascal':
+        return '%s (%s)' % (record['phase'], PHASE_FUNCTIONS[record['phase']])
+
+    return record['phase']
+
+def compare(baseline, current, threshold, memory_threshold, alpha):
+    '''
+    RETURN: list of findings, one dict per compared result
+    '''
+    previous = dict((result_key(record), record) for record in baseline['results'])
+    findings = []
+
+    for record in current['results']:
+
+        before = previous.get(result_key(record))
+
+        if before is None or before['error'] is not None:
+            continue
+
+        finding = {'engine'     : record['engine'],
+                   'workload'   : record['workload'],
+                   'size'       : record['size'],
+                   'phase'      : phase_label(record),
+                   'regression' : [],
+                   'error'      : record['error']}
+        findings.append(finding)
+
+        if record['error'] is not None:
+            finding['regression'].append('now fails')
+            continue
+
+        base_runs = before['runs']
+        runs      = record['runs']
+        change    = median(runs) / median(base_runs) - 1
+        noise     = max(relative_spread(base_runs), relative_spread(runs))
+        p         = mann_whitney_p(base_runs, runs)
+
+        finding.update({'time_change'       : change,
+                        'throughput_change' : 1 / (1 + change) - 1,
+                        'noise'             : noise,
+                        'p'                 : p})
+
+        if change > threshold and p < alpha:
+            finding['regression'].append('time')
+
+        base_peak = before['peak_kb']
+        peak      = record['peak_kb']
+        finding.update({'peak_kb' : peak, 'baseline_peak_kb' : base_peak})
+
+        if peak - base_peak >= MEMORY_SLACK_KB and peak > base_peak * (1 + memory_threshold):
+            finding['regression'].append('memory')
+
+    return findings
+
+def show(finding):
+
+    label = '%-12s %-8s %7d %-36s' % (finding['engine'], finding['workload'],
+                                      finding['size'], finding['phase'])
+
+    if finding['error'] is not None:
+        detail = finding['error']
+    else:
+        detail = 'time %+6.1f%% (noise %4.1f%%, p=%.3f)  peak %d -> %d KB' % (
+            finding['time_change'] * 100, finding['noise'] * 100, finding['p'],
+            finding['baseline_peak_kb'], finding['peak_kb'])
+
+    status = 'REGRESSION ' + ','.join(finding['regression']) if finding['regression'] else 'ok'
+
+    return '%s %s  %s' % (label, detail, status)
+
+
+# Commands #
+
+def load(path):
+
+    with open(path) as fp:
+        return json.load(fp)
+
+def save(path, data):
+
+    with open(path, 'w') as fp:
+        fp.write(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+def run_config(config):
+    '''
+    Run the suite as described by a baseline's config
+    '''
+    engines = [engine for engine in ENGINES if engine[0] in config['engines']]
+
+    return run_suite(engines, config['workloads'], config['sizes'], config['repeats'], log_record)
+
+def main():
+
+    args = sys.argv[1:]
+
+    if len(args) < 2 or args[0] not in ('save', 'check'):
+        print >> sys.stderr, __doc__
+        sys.exit(2)
+
+    command, baseline_path = args[0], args[1]
+    args    = args[2:]
+    config  = {'engines'   : [engine[0] for engine in ENGINES],
+               'workloads' : list(WORKLOADS),
+               'sizes'     : GATE_SIZES,
+               'repeats'   : DEFAULT_REPEATS}
+    repeats          = None
+    sizes            = None
+    engines          = None
+    workloads        = None
+    threshold        = DEFAULT_THRESHOLD
+    memory_threshold = DEFAULT_MEMORY_THRESHOLD
+    alpha            = DEFAULT_ALPHA
+    current_path     = None
+    output           = None
+
+    while args:
+        arg = args.pop(0)
+        if arg == '--quick':
+            sizes = bench_suite.QUICK_SIZES
+        elif arg == '--full':
+            sizes = bench_suite.FULL_SIZES
+        elif arg == '-r':
+            repeats = int(args.pop(0))
+        elif arg == '-e':
+            engines = args.pop(0).split(',')
+        elif arg == '-w':
+            workloads = args.pop(0).split(',')
+        elif arg == '-t':
+            threshold = float(args.pop(0))
+        elif arg == '-m':
+            memory_threshold = float(args.pop(0))
+        elif arg == '-a':
+            alpha = float(args.pop(0))
+        elif arg == '--current':
+            current_path = args.pop(0)
+        elif arg == '-o':
+            output = args.pop(0)
+        else:
+            print >> sys.stderr, __doc__
+            sys.exit(2)
+
+    if command == 'save':
+        if sizes is not None:
+            config['sizes'] = sizes
+        if engines is not None:
+            config['engines'] = engines
+        if workloads is not None:
+            config['workloads'] = workloads
+        if repeats is not None:
+            config['repeats'] = repeats
+        save(baseline_path, {'config' : config, 'report' : run_config(config)})
+        return
+
+    if sizes is not None:
+        # sizes the baseline was not run at could not be compared
+        print >> sys.stderr, '--quick and --full only apply to save; check uses the baseline sizes'
+        sys.exit(2)
+
+    baseline = load(baseline_path)
+    config   = baseline['config']
+
+    # -e and -w select part of the baseline to check
+    if engines is not None:
+        config['engines'] = [name for name in config['engines'] if name in engines]
+    if workloads is not None:
+        config['workloads'] = [name for name in config['workloads'] if name in workloads]
+
+    if not config['engines'] or not config['workloads']:
+        print >> sys.stderr, 'No engine or workload of the baseline selected'
+        sys.exit(2)
+
+    if repeats is not None:
+        config['repeats'] = repeats
+
+    if current_path is not None:
+        current = load(current_path)
+        current = current.get('report', current)
+        current['results'] = [record for record in current['results']
+                              if record['engine'] in config['engines']
+                              and record['workload'] in config['workloads']]
+    else:
+        current = run_config(config)
+
+    if output is not None:
+        save(output, {'config' : config, 'report' : current})
+
+    findings    = compare(baseline['report'], current, threshold, memory_threshold, alpha)
+    regressions = [finding for finding in findings if finding['regression']]
+
+    for finding in findings:
+        print show(finding)
+
+    print '%d compared, %d regressions' % (len(findings), len(regressions))
+
+    if regressions:
+        sys.exit(REGRESSION_STATUS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Benchmark comparing the char-by-char lexer with the
+single-pass regex lexer of eval_pascal
+
+usage: python benchmarks/bench_lexer.py [statements]
+
+Author: GotoCode
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from eval_pascal import Interpreter, EOF, CHAR_LEXER, REGEX_LEXER, COLUMNAR_LEXER
+
+
+def make_source(statements):
+    '''
+    Build a flat Pascal program with the given number
+    of assignment statements
+    '''
+    lines = ['BEGIN']
+    
+    for i in range(statements):
+        lines.append('    var_%d := (var_%d + %d) * 3 div 2 - -%d;' % (i, i - 1, i, i))
+    
+    lines.append('    done := 1')
+    lines.append('END.')
+    
+    return '\n'.join(lines)
+
+def tokenize(text, lexer):
+    '''
+    Drain the lexer and return the number of tokens seen
+    '''
+    interpreter = Interpreter(text, lexer=lexer)
+    count = 1
+    
+    while interpreter.curr_token.type != EOF:
+        interpreter.curr_token = interpreter.get_next_token()
+        count += 1
+    
+    return count
+
+def bench(text, lexer, repeat=3):
+    '''
+    Return (tokens, best seconds) over several runs
+    '''
+    best = None
+    
+    for _ in range(repeat):
+        start  = time.time()
+        tokens = tokenize(text, lexer)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    
+    return tokens, best
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text = make_source(statements)
+    
+    print 'source: %d statements, %d bytes' % (statements, len(text))
+    
+    for lexer in (CHAR_LEXER, REGEX_LEXER, COLUMNAR_LEXER):
+        tokens, seconds = bench(text, lexer)
+        print '%-8s lexer: %8d tokens in %.3fs -> %12.0f tokens/s' % (lexer, tokens, seconds, tokens / seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Compare the recursive expr/term/factor parser with the
+precedence-climbing climb_expr on long and deeply nested
+expressions
+
+usage: python benchmarks/bench_parser.py [terms] [depth]
+
+Author: GotoCode
+'''
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc5
+import calc6
+import eval_pascal
+from eval_pascal import CLIMBING_PARSER, DESCENT_PARSER
+
+
+def flat_expression(terms):
+    
+    ops = [' + ', ' * ', ' - ', ' / ']
+    
+    return '1' + ''.join(ops[i % 4] + str(i % 9 + 1) for i in range(terms))
+
+def nested_expression(depth):
+    
+    return '(' * depth + '1' + ' + 2)' * depth
+
+def tokenize(module, text):
+    '''
+    Lex once up front so only parsing is timed
+    '''
+    interpreter = module.Interpreter(text)
+    tokens = [interpreter.curr_token]
+    
+    while tokens[-1].type != module.EOF:
+        tokens.append(interpreter.get_next_token())
+    
+    return tokens
+
+def parse(module, text, tokens, parser):
+    '''
+    RETURN: seconds to parse, or None on RecursionError
+    '''
+    interpreter = module.Interpreter(text, parser=parser)
+    interpreter.get_next_token = iter(tokens).next
+    interpreter.curr_token     = interpreter.get_next_token()
+    
+    # keep cyclic GC passes over the growing tree out of the timing
+    gc.disable()
+    start = time.time()
+    
+    try:
+        interpreter.expr()
+    except RuntimeError:
+        return None
+    finally:
+        gc.enable()
+    
+    return time.time() - start
+
+def show(seconds):
+    
+    return 'RecursionError' if seconds is None else '%.3fs' % seconds
+
+
+def main():
+    
+    terms = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    
+    workloads = [('%d-term flat' % terms, flat_expression(terms)),
+                 ('%d-deep parens' % depth, nested_expression(depth))]
+    
+    for label, text in workloads:
+        print label
+        for module in (calc5, calc6, eval_pascal):
+            if module is eval_pascal:
+                text = text.replace('/', 'div')
+            tokens   = tokenize(module, text)
+            descent  = parse(module, text, tokens, DESCENT_PARSER)
+            climbing = parse(module, text, tokens, CLIMBING_PARSER)
+            speedup  = '%.2fx' % (descent / climbing) if descent else '-'
+            print '    %-12s descent %-15s climbing %-10s speedup %s' % (
+                module.__name__, show(descent), show(climbing), speedup)
+
+
+if __name__ == '__main__':
+    main()
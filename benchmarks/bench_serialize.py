@@ -0,0 +1,61 @@
+'''
+Compare loading a program from the binary AST format with
+parsing it from source (and with cPickle)
+
+usage: python benchmarks/bench_serialize.py [statements]
+
+Author: GotoCode
+'''
+
+import cPickle
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pascal_serialize
+from eval_pascal import Interpreter
+
+from bench_engines import make_source
+
+
+def timed(func, arg, repeat=3):
+    '''
+    RETURN: best seconds over several runs
+    '''
+    best = None
+    
+    for _ in range(repeat):
+        gc.disable()
+        start = time.time()
+        func(arg)
+        elapsed = time.time() - start
+        gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    
+    return best
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text       = make_source(statements)
+    ast        = Interpreter(text).program()
+    binary     = pascal_serialize.dumps(ast)
+    pickled    = cPickle.dumps(ast, cPickle.HIGHEST_PROTOCOL)
+    
+    parse = timed(lambda source: Interpreter(source).program(), text)
+    load  = timed(pascal_serialize.loads, binary)
+    unpickle = timed(cPickle.loads, pickled)
+    
+    print '%d statements' % statements
+    print 'source   : %9d bytes  parse    %.3fs' % (len(text), parse)
+    print 'binary   : %9d bytes  loads    %.3fs  (%.2fx faster than parsing)' % (len(binary), load, parse / load)
+    print 'cPickle  : %9d bytes  loads    %.3fs' % (len(pickled), unpickle)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,482 @@
+'''
+Benchmark suite covering every engine and phase
+
+Each engine is timed separately on lexing, parsing and
+evaluation against generated workloads of increasing size,
+and the results - with peak memory and a scaling exponent
+per engine, workload and phase - are written as JSON
+
+Engines that evaluate while they parse (eval, eval2, eval3,
+calc1 - calc4) have no parse phase of their own; their eval
+phase is the whole lex + parse + evaluate pass and is marked
+"fused" in the results
+
+usage: python benchmarks/bench_suite.py [--quick | --full] [-r REPEATS]
+                                        [-e ENGINE,...] [-w WORKLOAD,...]
+                                        [-o FILE]
+
+Author: GotoCode
+'''
+
+import gc
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pascal_workload import generate_program
+
+
+# Grammars accepted by the engines
+
+PAIR     = 'pair'       # INTEGER (+|-) INTEGER
+ADDITIVE = 'additive'   # chains of + and -
+FLAT     = 'flat'       # chains of + - * / without parentheses
+FULL     = 'full'       # + - * / with parentheses
+PASCAL   = 'pascal'     # eval_pascal programs
+
+# Workloads
+
+SHORT   = 'short'       # many short expressions
+CHAIN   = 'chain'       # one long operator chain
+NESTED  = 'nested'      # deeply nested parentheses
+PROGRAM = 'program'     # many Pascal statements
+RANDOM  = 'random'      # seeded pascal_workload programs
+
+WORKLOADS = (SHORT, CHAIN, NESTED, PROGRAM, RANDOM)
+
+# what a workload's size counts
+UNITS = {SHORT   : 'expressions',
+         CHAIN   : 'terms',
+         NESTED  : 'levels',
+         PROGRAM : 'statements',
+         RANDOM  : 'statements'}
+
+DIALECT_WORKLOADS = {PAIR     : (SHORT,),
+                     ADDITIVE : (SHORT, CHAIN),
+                     FLAT     : (SHORT, CHAIN),
+                     FULL     : (SHORT, CHAIN, NESTED),
+                     PASCAL   : (SHORT, CHAIN, NESTED, PROGRAM, RANDOM)}
+
+# Phases
+
+LEX   = 'lex'
+PARSE = 'parse'
+EVAL  = 'eval'
+
+# (module name, dialect, builds an AST)
+ENGINES = [('eval',        ADDITIVE, False),
+           ('eval2',       FULL,     False),
+           ('eval3',       FULL,     False),
+           ('calc1',       PAIR,     False),
+           ('calc2',       FLAT,     False),
+           ('calc3',       FLAT,     False),
+           ('calc4',       FLAT,     False),
+           ('calc5',       FULL,     True),
+           ('calc6',       FULL,     True),
+           ('eval_pascal', PASCAL,   True)]
+
+QUICK_SIZES   = {SHORT   : [100, 1000],
+                 CHAIN   : [100, 1000],
+                 NESTED  : [10, 100],
+                 PROGRAM : [100, 1000],
+                 RANDOM  : [100, 1000]}
+
+DEFAULT_SIZES = {SHORT   : [1000, 10000],
+                 CHAIN   : [1000, 10000, 100000],
+                 NESTED  : [100, 1000, 10000],
+                 PROGRAM : [1000, 10000, 100000],
+                 RANDOM  : [1000, 10000, 100000]}
+
+FULL_SIZES    = {SHORT   : [1000, 10000, 100000],
+                 CHAIN   : [1000, 10000, 100000],
+                 NESTED  : [100, 1000, 10000],
+                 PROGRAM : [1000, 10000, 100000, 1000000],
+                 RANDOM  : [1000, 10000, 100000, 1000000]}
+
+DEFAULT_REPEATS = 3
+
+# variables a generated program cycles through
+PROGRAM_VARIABLES = 1000
+
+# seed for the random workload, so runs are comparable
+WORKLOAD_SEED = 0
+
+
+# Workload generators #
+
+def short_expression(dialect, i):
+
+    a, b, c = i % 97 + 1, i % 89 + 1, i % 7 + 1
+
+    if dialect == PAIR:
+        return '%d + %d' % (a, b)
+    elif dialect == ADDITIVE:
+        return '%d + %d - %d' % (a, b, c)
+    elif dialect == FLAT:
+        return '%d + %d * %d - %d / %d' % (a, b, c, a, c)
+    elif dialect == FULL:
+        return '(%d + %d) * %d - %d / %d' % (a, b, c, a, c)
+    else:
+        return 'BEGIN x := (%d + %d) * %d - %d div %d END.' % (a, b, c, a, c)
+
+def chain_expression(dialect, terms):
+    '''
+    Operators cycle so that the value stays bounded under both
+    left-to-right and precedence evaluation
+    '''
+    if dialect == ADDITIVE:
+        ops = [' + ', ' - ']
+    elif dialect == PASCAL:
+        ops = [' + ', ' * ', ' - ', ' div ']
+    else:
+        ops = [' + ', ' * ', ' - ', ' / ']
+
+    text = '1' + ''.join(ops[i % len(ops)] + str(i % 9 + 1) for i in xrange(1, terms))
+
+    return 'BEGIN x := %s END.' % text if dialect == PASCAL else text
+
+def nested_expression(dialect, depth):
+
+    text = '(' * depth + '1' + ' + 2)' * depth
+
+    return 'BEGIN x := %s END.' % text if dialect == PASCAL else text
+
+def pascal_program(statements):
+
+    lines = ['    v0 := 1']
+
+    for i in xrange(1, statements):
+        lines.append('    v%d := (v%d + %d) * 3 div 4 - -v0' % (i % PROGRAM_VARIABLES,
+                                                            (i - 1) % PROGRAM_VARIABLES, i))
+
+    return 'BEGIN\n' + ';\n'.join(lines) + '\nEND.'
+
+def make_workload(workload, dialect, size):
+    '''
+    RETURN: list of source texts
+    '''
+    if workload == SHORT:
+        return [short_expression(dialect, i) for i in xrange(size)]
+    elif workload == CHAIN:
+        return [chain_expression(dialect, size)]
+    elif workload == NESTED:
+        return [nested_expression(dialect, size)]
+    elif workload == PROGRAM:
+        return [pascal_program(size)]
+    else:
+        return [generate_program(size, seed=WORKLOAD_SEED)]
+
+
+# Phases #
+
+def tokenize(module, text):
+    '''
+    RETURN: list of tokens in text, without the EOF token
+    '''
+    if hasattr(module, 'make_lexer'):
+        tokens = []
+        for token in module.make_lexer(text):
+            if token['type'] == module.EOF:
+                return tokens
+            tokens.append(token)
+
+    interpreter = module.Interpreter(text)
+    token  = interpreter.curr_token or interpreter.get_next_token()
+    tokens = []
+
+    while token.type != module.EOF:
+        tokens.append(token)
+        token = interpreter.get_next_token()
+
+    return tokens
+
+def lex_all(module, texts):
+
+    return [tokenize(module, text) for text in texts]
+
+def primed_parsers(module, texts, token_lists):
+    '''
+    Interpreters reading from already lexed tokens,
+    so only parsing is timed
+    '''
+    interpreters = []
+
+    for text, tokens in zip(texts, token_lists):
+        interpreter = module.Interpreter(text)
+        interpreter.get_next_token = iter(tokens + [module.FIXED_TOKENS[module.EOF]]).next
+        interpreter.curr_token     = interpreter.get_next_token()
+        interpreters.append(interpreter)
+
+    return interpreters
+
+def parse_all(module, interpreters):
+
+    if module.__name__ == 'eval_pascal':
+        return [interpreter.program() for interpreter in interpreters]
+
+    return [interpreter.expr() for interpreter in interpreters]
+
+def eval_all(module, asts):
+
+    scope = getattr(module, 'GLOBAL_SCOPE', None)
+
+    for ast in asts:
+        if scope is not None:
+            scope.clear()
+        module.eval_AST(ast)
+
+def eval_fused(module, texts):
+    '''
+    Single pass engines: lex, parse and evaluate together
+    '''
+    name = module.__name__
+
+    for text in texts:
+        if name == 'eval':
+            module.eval(text)
+        elif name == 'eval2':
+            module.Interpreter(text).group()
+        elif name == 'eval3':
+            module.Interpreter(text).expr()
+        else:
+            module.Interpreter(text).eval()
+
+def phases(module, builds_ast, texts, token_lists):
+    '''
+    RETURN: list of (phase, fused, prepare, run); prepare()
+            builds fresh input for one timed run(input)
+    '''
+    result = [(LEX, False, lambda: texts, lambda state: lex_all(module, state))]
+
+    if builds_ast:
+        asts = []
+
+        def prepare_eval():
+            # parsed once, on first use; evaluation leaves the trees intact
+            if not asts:
+                asts.extend(parse_all(module, primed_parsers(module, texts, token_lists)))
+            return asts
+
+        result.append((PARSE, False,
+                       lambda: primed_parsers(module, texts, token_lists),
+                       lambda state: parse_all(module, state)))
+        result.append((EVAL, False, prepare_eval, lambda state: eval_all(module, state)))
+    else:
+        result.append((EVAL, True, lambda: texts, lambda state: eval_fused(module, state)))
+
+    return result
+
+
+# Measurement #
+
+def peak_kb():
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def timed(run, state):
+
+    # keep cyclic GC passes over growing structures out of the timing
+    gc.disable()
+    start = time.time()
+
+    try:
+        run(state)
+    finally:
+        gc.enable()
+
+    return time.time() - start
+
+def measure_child(queue, prepare, run, state, repeats):
+    '''
+    Runs in a forked process, so the peak RSS it reports is
+    the growth caused by this phase alone
+    '''
+    try:
+        before  = peak_kb()
+        seconds = [timed(run, state)]
+        peak    = peak_kb() - before
+        del state
+        for _ in xrange(repeats - 1):
+            seconds.append(timed(run, prepare()))
+        queue.put((seconds, peak, None))
+    except BaseException as e:
+        queue.put((None, None, '%s: %s' % (type(e).__name__, str(e)[:200])))
+
+def measure(prepare, run, repeats):
+    '''
+    RETURN: (list of seconds per run, peak KB, error or None)
+    '''
+    try:
+        state = prepare()
+    except Exception as e:
+        return None, None, '%s: %s' % (type(e).__name__, str(e)[:200])
+
+    queue   = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure_child,
+                                      args=(queue, prepare, run, state, repeats))
+    process.start()
+
+    try:
+        result = queue.get()
+    finally:
+        process.join()
+
+    return result
+
+def scaling_exponent(sizes, seconds):
+    '''
+    Least squares slope of log(seconds) against log(size):
+    about 1 for linear work, 2 for quadratic
+    '''
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(second, 1e-9)) for second in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+def run_suite(engines, workloads, sizes, repeats, log=None):
+    '''
+    RETURN: dict ready to be written as JSON
+    '''
+    results = []
+
+    for name, dialect, builds_ast in engines:
+
+        module = importlib.import_module(name)
+
+        for workload in workloads:
+
+            if workload not in DIALECT_WORKLOADS[dialect]:
+                continue
+
+            for size in sizes[workload]:
+
+                texts       = make_workload(workload, dialect, size)
+                token_lists = lex_all(module, texts)
+                tokens      = sum(len(tokens) for tokens in token_lists)
+
+                for phase, fused, prepare, run in phases(module, builds_ast, texts, token_lists):
+
+                    seconds, peak, error = measure(prepare, run, repeats)
+                    record = {'engine'   : name,
+                              'workload' : workload,
+                              'size'     : size,
+                              'unit'     : UNITS[workload],
+                              'phase'    : phase,
+                              'fused'    : fused,
+                              'tokens'   : tokens,
+                              'error'    : error}
+
+                    if error is None:
+                        best = min(seconds)
+                        record.update({'seconds'        : best,
+                                       'runs'           : seconds,
+                                       'ops_per_sec'    : size / best if best else None,
+                                       'tokens_per_sec' : tokens / best if best else None,
+                                       'ns_per_token'   : best * 1e9 / tokens if tokens else None,
+                                       'peak_kb'        : peak})
+
+                    results.append(record)
+
+                    if log is not None:
+                        log(record)
+
+                del texts, token_lists
+
+    return {'python'  : platform.python_version(),
+            'repeats' : repeats,
+            'results' : results,
+            'scaling' : scaling(results)}
+
+def scaling(results):
+    '''
+    Group successful results into one curve per
+    engine, workload and phase
+    '''
+    curves = {}
+
+    for record in results:
+        if record['error'] is None:
+            key = (record['engine'], record['workload'], record['phase'])
+            curves.setdefault(key, []).append(record)
+
+    output = []
+
+    for (engine, workload, phase), records in sorted(curves.items()):
+        records.sort(key=lambda record: record['size'])
+        sizes   = [record['size'] for record in records]
+        seconds = [record['seconds'] for record in records]
+        output.append({'engine'       : engine,
+                       'workload'     : workload,
+                       'phase'        : phase,
+                       'sizes'        : sizes,
+                       'seconds'      : seconds,
+                       'ns_per_token' : [record['ns_per_token'] for record in records],
+                       'peak_kb'      : [record['peak_kb'] for record in records],
+                       'exponent'     : scaling_exponent(sizes, seconds) if len(sizes) > 1 else None})
+
+    return output
+
+def log_record(record):
+
+    label = '%-12s %-8s %8d %-6s' % (record['engine'], record['workload'], record['size'], record['phase'])
+
+    if record['error'] is not None:
+        print >> sys.stderr, label, record['error']
+    else:
+        print >> sys.stderr, label, '%9.4fs %10.0f ns/token %8d KB' % (record['seconds'],
+                                                                      record['ns_per_token'] or 0,
+                                                                      record['peak_kb'])
+
+
+def main():
+
+    args    = sys.argv[1:]
+    sizes   = DEFAULT_SIZES
+    repeats = DEFAULT_REPEATS
+    engines = ENGINES
+    chosen  = WORKLOADS
+    output  = None
+
+    while args:
+        arg = args.pop(0)
+        if arg == '--quick':
+            sizes = QUICK_SIZES
+        elif arg == '--full':
+            sizes = FULL_SIZES
+        elif arg == '-r':
+            repeats = int(args.pop(0))
+        elif arg == '-e':
+            names   = args.pop(0).split(',')
+            engines = [engine for engine in ENGINES if engine[0] in names]
+        elif arg == '-w':
+            names  = args.pop(0).split(',')
+            chosen = [workload for workload in WORKLOADS if workload in names]
+        elif arg == '-o':
+            output = args.pop(0)
+        else:
+            print >> sys.stderr, __doc__
+            sys.exit(2)
+
+    report = run_suite(engines, chosen, sizes, repeats, log_record)
+    text   = json.dumps(report, indent=2, sort_keys=True)
+
+    if output is None:
+        print text
+    else:
+        with open(output, 'w') as fp:
+            fp.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+Micro-benchmark for the flyweight token tables: counts how
+many Token objects the lexers of calc5, calc6 and eval_pascal
+still allocate per 1M tokens
+
+usage: python benchmarks/bench_tokens.py
+
+Author: GotoCode
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc5
+import calc6
+import eval_pascal
+
+
+PER = 1000000
+
+
+def pascal_source(statements):
+    
+    body = ';\n'.join('    x%d := (x%d + %d) * -3 div 2' % (i, i, i) for i in range(statements))
+    
+    return 'BEGIN\n' + body + '\nEND.'
+
+def calc_source(terms):
+    
+    return ' + '.join('(%d * -%d - %d / 2)' % (i, i, i) for i in range(1, terms))
+
+def count_allocations(module, interpreter):
+    '''
+    Drain the lexer; RETURN: (tokens, tokens not taken from a shared table)
+    '''
+    shared = set(id(token) for token in module.FIXED_TOKENS.values())
+    shared.update(id(token) for token in getattr(module, 'RESERVED_KEYWORDS', {}).values())
+    
+    tokens    = 1
+    allocated = 0 if id(interpreter.curr_token) in shared else 1
+    
+    while interpreter.curr_token.type != module.EOF:
+        interpreter.curr_token = interpreter.get_next_token()
+        tokens += 1
+        if id(interpreter.curr_token) not in shared:
+            allocated += 1
+    
+    return tokens, allocated
+
+
+def main():
+    
+    token_size = sys.getsizeof(eval_pascal.Token(eval_pascal.ID, 'x'))
+    
+    cases = [('calc5', calc5, calc5.Interpreter(calc_source(20000))),
+             ('calc6', calc6, calc6.Interpreter(calc_source(20000))),
+             ('eval_pascal', eval_pascal, eval_pascal.Interpreter(pascal_source(20000)))]
+    
+    print '%-12s %10s %14s %14s %12s' % ('lexer', 'tokens', 'allocs/1M', 'saved/1M', 'bytes saved')
+    
+    for name, module, interpreter in cases:
+        tokens, allocated = count_allocations(module, interpreter)
+        # before the tables every token was a fresh object
+        per_million = allocated * PER // tokens
+        saved       = PER - per_million
+        print '%-12s %10d %14d %14d %12d' % (name, tokens, per_million, saved, saved * token_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Compare instructions/second of the bytecode VM with the
+recursive eval_AST tree walker on the same program
+
+usage: python benchmarks/bench_vm.py [statements] [runs]
+
+Author: GotoCode
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eval_pascal
+import pascal_vm
+from eval_pascal import Interpreter
+
+from bench_engines import make_source
+
+
+def main():
+    
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    runs       = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    text       = make_source(statements)
+    
+    ast     = Interpreter(text).program()
+    program = pascal_vm.compile_program(ast)
+    count   = len(program) * runs
+    
+    start = time.time()
+    for _ in range(runs):
+        eval_pascal.GLOBAL_SCOPE.clear()
+        eval_pascal.eval_AST(ast)
+    walker = time.time() - start
+    
+    start = time.time()
+    for _ in range(runs):
+        result = pascal_vm.run(program)
+    vm = time.time() - start
+    
+    print '%d instructions x %d runs' % (len(program), runs)
+    print 'eval_AST : %.3fs  %12.0f instructions/s' % (walker, count / walker)
+    print 'VM       : %.3fs  %12.0f instructions/s' % (vm, count / vm)
+    print 'same result: %s' % (result == eval_pascal.GLOBAL_SCOPE)
+
+
+if __name__ == '__main__':
+    main()
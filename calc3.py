@@ -8,6 +8,8 @@ Inspired by tutorial from Ruslan Spivak
 Author: GotoCode
 '''
 
+import sys
+
 
 # Token Types
 
@@ -190,10 +192,55 @@ class Interpreter(object):
         self.text = result_text
 
 
+# Pipe mode #
+
+# bytes of input read per block, results written per flush
+PIPE_BLOCK_SIZE  = 1 << 20
+PIPE_FLUSH_LINES = 4096
+
+def pipe_main(stdin=None, stdout=None):
+    '''
+    Non-interactive mode for piped input: no prompts, input
+    read in large blocks and results written in batches
+    '''
+    stdin   = stdin or sys.stdin
+    stdout  = stdout or sys.stdout
+    results = []
+    
+    try:
+        while True:
+            
+            lines = stdin.readlines(PIPE_BLOCK_SIZE)
+            
+            if not lines:
+                break
+            
+            for line in lines:
+                
+                line = line.rstrip('\n')
+                
+                # ignore any empty lines of input
+                if not line:
+                    continue
+                
+                results.append('%s\n' % Interpreter(line).eval())
+                
+                if len(results) >= PIPE_FLUSH_LINES:
+                    stdout.write(''.join(results))
+                    del results[:]
+    finally:
+        stdout.write(''.join(results))
+        stdout.flush()
+
+
 def main():
     '''
     Main logic for presenting CLI to user of interpreter
     '''
+    if not sys.stdin.isatty():
+        pipe_main()
+        return
+    
     while True:
 
         try:
@@ -8,6 +8,9 @@ Inspired by tutorial from Ruslan Spivak
 Author: GotoCode
 '''
 
+import re
+import sys
+
 
 # Token Types
 
@@ -20,11 +23,30 @@ LPAREN   = 'LPAREN'
 RPAREN   = 'RPAREN'
 EOF      = 'EOF'
 
+# Parser selection
+
+CLIMBING_PARSER = 'climbing'
+DESCENT_PARSER  = 'descent'
+
+DEFAULT_PARSER = CLIMBING_PARSER
+
+# operator table for the precedence-climbing parser
+BINARY_PRECEDENCE = {PLUS     : 1,
+                     MINUS    : 1,
+                     MULTIPLY : 2,
+                     DIVIDE   : 2}
+
+# operator stack markers (below every binary precedence)
+PAREN = 0
+UNARY = -1
+
 
 # A Token is a pair - (type, value)
 
 class Token(object):
     
+    __slots__ = ('type', 'value')
+    
     def __init__(self, type, value):
         self.type  = type
         self.value = value
@@ -36,6 +58,32 @@ class Token(object):
         return self.__str__()
 
 
+# A FixedToken is shared by every occurrence of its lexeme,
+# so it must never be modified once built
+
+class FixedToken(Token):
+    
+    __slots__ = ()
+    
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('FixedToken is immutable')
+
+
+# Flyweight table of fixed-value tokens
+
+FIXED_TOKENS = {PLUS     : FixedToken(PLUS, '+'),
+                MINUS    : FixedToken(MINUS, '-'),
+                MULTIPLY : FixedToken(MULTIPLY, '*'),
+                DIVIDE   : FixedToken(DIVIDE, '/'),
+                LPAREN   : FixedToken(LPAREN, '('),
+                RPAREN   : FixedToken(RPAREN, ')'),
+                EOF      : FixedToken(EOF, None)}
+
+
 # Abstract Syntax Tree #
 
 class BinOp(object):
@@ -133,6 +181,29 @@ def eval_AST(ast):
         elif isinstance(ast, IntNode):
             return ast.value
 
+# constant folding optimisation pass
+def fold_constants(ast):
+    '''
+    Fold every BinOp whose operands are all
+    IntNodes into a single IntNode (the tree is rewritten
+    in place)
+    
+    RETURN: (new root, number of nodes eliminated)
+    '''
+    if isinstance(ast, BinOp):
+        ast.left, left_count   = fold_constants(ast.left)
+        ast.right, right_count = fold_constants(ast.right)
+        eliminated = left_count + right_count
+        
+        # division by zero is left for run time to report
+        if (isinstance(ast.left, IntNode) and isinstance(ast.right, IntNode)
+                and not (ast.op.type == DIVIDE and ast.right.value == 0)):
+            return IntNode(Token(INTEGER, handle_binop(ast))), eliminated + 2
+        
+        return ast, eliminated
+    else:
+        return ast, 0
+
 def get_rpn(ast):
     if ast is None:
         raise Exception("Invalid AST for input expression")
@@ -142,19 +213,74 @@ def get_rpn(ast):
         elif isinstance(ast, IntNode):
             return str(ast.value)
 
+# prefix notation operators used by handle_binop_lisp
+LISP_OPERATORS = {PLUS     : '+',
+                  MINUS    : '-',
+                  MULTIPLY : '*',
+                  DIVIDE   : '/'}
+
+def lisp_parts(ast):
+    '''
+    Walk an AST with an explicit work stack, so arbitrarily
+    deep trees use bounded Python stack depth
+    
+    RETURN: list of the text pieces get_rpn would join, with
+            each IntNode leaf in place of its value
+    '''
+    if ast is None:
+        raise Exception("Invalid AST for input expression")
+    
+    parts = []
+    emit  = parts.append
+    work  = [ast]
+    push  = work.append
+    pop   = work.pop
+    
+    while work:
+        
+        node = pop()
+        kind = type(node)
+        
+        if kind is str or kind is IntNode:
+            emit(node)
+        elif kind is BinOp:
+            symbol = LISP_OPERATORS.get(node.op.type)
+            if symbol is None:
+                raise Exception("Unknown operator found")
+            push(')')
+            push(node.right)
+            push(' ')
+            push(node.left)
+            push('(' + symbol + ' ')
+        else:
+            raise Exception("Invalid AST for input expression")
+    
+    return parts
+
+# non-recursive get_rpn
+def get_rpn_iterative(ast):
+    '''
+    RETURN: same text as get_rpn(ast)
+    '''
+    return ''.join([part if type(part) is str else str(part.value)
+                    for part in lisp_parts(ast)])
+
 
 # An Interpreter which converts a single-line
 # expression into a stream of tokens
 
 class Interpreter(object):
     
-    def __init__(self, text):
+    def __init__(self, text, parser=None):
         # input expression
         self.text = text
         # pointer to current symbol
         self.pos  = 0
         # character being pointed at by 'pos' index
         self.curr_char = self.text[self.pos]
+        # expressions go through climb_expr unless asked for descent
+        if (parser or DEFAULT_PARSER) == CLIMBING_PARSER:
+            self.expr = self.climb_expr
         # most recent token available for processing
         self.curr_token = self.get_next_token()
         
@@ -215,37 +341,37 @@ class Interpreter(object):
             elif self.curr_char == '+':
             
                 self.advance()
-                return Token(PLUS, '+')
+                return FIXED_TOKENS[PLUS]
                 
             elif self.curr_char == '-':
             
                 self.advance()
-                return Token(MINUS, '-')
+                return FIXED_TOKENS[MINUS]
             
             elif self.curr_char == '*':
                 
                 self.advance()
-                return Token(MULTIPLY, '*')
+                return FIXED_TOKENS[MULTIPLY]
             
             elif self.curr_char == '/':
                 
                 self.advance()
-                return Token(DIVIDE, '/')
+                return FIXED_TOKENS[DIVIDE]
             
             elif self.curr_char == '(':
                 
                 self.advance()
-                return Token(LPAREN, '(')
+                return FIXED_TOKENS[LPAREN]
             
             elif self.curr_char == ')':
                 
                 self.advance()
-                return Token(RPAREN, ')')
+                return FIXED_TOKENS[RPAREN]
                 
             else:
                 self.error()
         
-        return Token(EOF, None)
+        return FIXED_TOKENS[EOF]
     
     def consume(self, type):
         '''
@@ -260,6 +386,74 @@ class Interpreter(object):
     
     ### PARSER CODE ###
     
+    def climb_expr(self):
+        '''
+        Precedence-climbing expression parser driven by
+        BINARY_PRECEDENCE; parentheses are kept on an
+        explicit stack instead of recursing
+        
+        RETURN: same tree as the expr/term/factor rules
+        '''
+        operands   = []
+        # pending operator tokens and their precedence (or marker)
+        ops        = []
+        kinds      = []
+        depth      = 0
+        precedence_of = BINARY_PRECEDENCE.get
+        next_token    = self.get_next_token
+        token         = self.curr_token
+        
+        while True:
+            
+            # operand position
+            type = token.type
+            
+            if type == INTEGER:
+                operands.append(IntNode(token))
+            elif type == LPAREN:
+                ops.append(token)
+                kinds.append(PAREN)
+                depth += 1
+                token = self.curr_token = next_token()
+                continue
+            else:
+                self.error()
+            
+            token = self.curr_token = next_token()
+            
+            # operator position: close any finished groups first
+            while depth and token.type == RPAREN:
+                while kinds[-1] > PAREN:
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                ops.pop()
+                kinds.pop()
+                depth -= 1
+                token = self.curr_token = next_token()
+            
+            precedence = precedence_of(token.type)
+            
+            if precedence is None:
+                while kinds:
+                    if kinds[-1] == PAREN:
+                        # an unclosed '(' is a missing RPAREN
+                        self.error()
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                return operands[-1]
+            
+            # reduce left-associative operators of equal or higher precedence
+            while kinds and kinds[-1] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                kinds.pop()
+            
+            ops.append(token)
+            kinds.append(precedence)
+            token = self.curr_token = next_token()
+    
     def expr(self):
         
         node = self.term()
@@ -319,13 +513,168 @@ class Interpreter(object):
         ast = self.expr()
         #print ast
         #return eval_AST(ast)
-        return get_rpn(ast)
+        return get_rpn_iterative(ast)
+    
+
+# Prepared expressions #
+
+# an expression's shape is its text with every literal replaced
+# by a placeholder and whitespace removed; expressions with the
+# same shape parse to the same tree
+LITERAL_REGEX    = re.compile(r'[0-9]+')
+WHITESPACE_REGEX = re.compile(r'\s+')
+PLACEHOLDER      = '#'
+
+# most templates kept by a TemplateCache
+DEFAULT_TEMPLATE_LIMIT = 4096
+
+def expression_shape(text):
+    '''
+    RETURN: (shape of text, list of its integer literals)
+    '''
+    shape    = WHITESPACE_REGEX.sub('', LITERAL_REGEX.sub(PLACEHOLDER, text))
+    literals = [int(literal) for literal in LITERAL_REGEX.findall(text)]
     
+    return shape, literals
+
+def compile_template(ast, params):
+    '''
+    Turn an AST into a closure over a list of literals that
+    renders it like get_rpn; each IntNode leaf becomes a
+    parameter slot, numbered in source order and appended
+    to params
+    '''
+    pieces = []
+    
+    # the rendered text never contains '%', so every other
+    # piece of the format string is a literal's '%d'
+    for part in lisp_parts(ast):
+        if type(part) is str:
+            pieces.append(part)
+        else:
+            params.append(part)
+            pieces.append('%d')
+    
+    form  = ''.join(pieces)
+    count = len(params)
+    
+    return lambda literals: form % tuple(literals[:count])
+
+class PreparedExpression(object):
+    '''
+    An expression parsed once into a template; eval() takes
+    the literals of any expression with the same shape
+    '''
+    def __init__(self, text):
+        shape, literals = expression_shape(text)
+        self.shape  = shape
+        # literals in the source text (trailing ones may be unused)
+        self.count  = len(literals)
+        self.params = []
+        self.code   = compile_template(Interpreter(text).expr(), self.params)
+    
+    def eval(self, literals):
+        '''
+        RETURN: same value as Interpreter(text).eval() for the
+                expression with these literals
+        '''
+        return self.code(literals)
+
+class TemplateCache(object):
+    '''
+    PreparedExpressions keyed by shape, with hit/miss counters;
+    once limit templates are held new shapes are not cached
+    '''
+    def __init__(self, limit=DEFAULT_TEMPLATE_LIMIT):
+        self.templates = {}
+        self.limit     = limit
+        self.hits      = 0
+        self.misses    = 0
+    
+    def eval(self, text):
+        '''
+        Evaluate text, parsing it only if its shape is new
+        '''
+        shape, literals = expression_shape(text)
+        template = self.templates.get(shape)
+        
+        if template is not None and template.count == len(literals):
+            self.hits += 1
+            return template.eval(literals)
+        
+        self.misses += 1
+        template = PreparedExpression(text)
+        
+        # placeholders already in the text give a shape whose
+        # literal count does not match; never cache those
+        if template.count == shape.count(PLACEHOLDER) and len(self.templates) < self.limit:
+            self.templates[shape] = template
+        
+        return template.eval(literals)
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+    
+    def stats(self):
+        return {'hits'      : self.hits,
+                'misses'    : self.misses,
+                'templates' : len(self.templates),
+                'hit_rate'  : self.hit_rate()}
+
+# process-wide cache used by pipe mode
+PREPARED = TemplateCache()
+
+
+# Pipe mode #
+
+# bytes of input read per block, results written per flush
+PIPE_BLOCK_SIZE  = 1 << 20
+PIPE_FLUSH_LINES = 4096
+
+def pipe_main(stdin=None, stdout=None):
+    '''
+    Non-interactive mode for piped input: no prompts, input
+    read in large blocks and results written in batches
+    '''
+    stdin   = stdin or sys.stdin
+    stdout  = stdout or sys.stdout
+    results = []
+    
+    try:
+        while True:
+            
+            lines = stdin.readlines(PIPE_BLOCK_SIZE)
+            
+            if not lines:
+                break
+            
+            for line in lines:
+                
+                line = line.rstrip('\n')
+                
+                # ignore any empty lines of input
+                if not line:
+                    continue
+                
+                results.append('%s\n' % PREPARED.eval(line))
+                
+                if len(results) >= PIPE_FLUSH_LINES:
+                    stdout.write(''.join(results))
+                    del results[:]
+    finally:
+        stdout.write(''.join(results))
+        stdout.flush()
+
 
 def main():
     '''
     Main logic for presenting CLI to user of interpreter
     '''
+    if not sys.stdin.isatty():
+        pipe_main()
+        return
+    
     while True:
 
         try:
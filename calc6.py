@@ -10,6 +10,13 @@ Inspired by tutorial from Ruslan Spivak
 Author: GotoCode
 '''
 
+import itertools
+import multiprocessing
+import operator
+import re
+import sys
+import time
+
 
 # Token Types
 
@@ -22,11 +29,30 @@ LPAREN   = 'LPAREN'
 RPAREN   = 'RPAREN'
 EOF      = 'EOF'
 
+# Parser selection
+
+CLIMBING_PARSER = 'climbing'
+DESCENT_PARSER  = 'descent'
+
+DEFAULT_PARSER = CLIMBING_PARSER
+
+# operator table for the precedence-climbing parser
+BINARY_PRECEDENCE = {PLUS     : 1,
+                     MINUS    : 1,
+                     MULTIPLY : 2,
+                     DIVIDE   : 2}
+
+# operator stack markers (below every binary precedence)
+PAREN = 0
+UNARY = -1
+
 
 # A Token is a pair - (type, value)
 
 class Token(object):
     
+    __slots__ = ('type', 'value')
+    
     def __init__(self, type, value):
         self.type  = type
         self.value = value
@@ -38,6 +64,36 @@ class Token(object):
         return self.__str__()
 
 
+# A FixedToken is shared by every occurrence of its lexeme,
+# so it must never be modified once built
+
+class FixedToken(Token):
+    
+    __slots__ = ()
+    
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('FixedToken is immutable')
+
+
+# Flyweight table of fixed-value tokens
+
+FIXED_TOKENS = {PLUS     : FixedToken(PLUS, '+'),
+                MINUS    : FixedToken(MINUS, '-'),
+                MULTIPLY : FixedToken(MULTIPLY, '*'),
+                DIVIDE   : FixedToken(DIVIDE, '/'),
+                LPAREN   : FixedToken(LPAREN, '('),
+                RPAREN   : FixedToken(RPAREN, ')'),
+                EOF      : FixedToken(EOF, None)}
+
+# operator tokens attached to UnaryOp nodes
+UNARY_TOKENS = {PLUS  : FixedToken(PLUS, 'PLUS'),
+                MINUS : FixedToken(MINUS, 'MINUS')}
+
+
 # Abstract Syntax Tree #
 
 class BinOp(object):
@@ -156,6 +212,101 @@ def eval_AST(ast):
         elif isinstance(ast, IntNode):
             return ast.value
 
+# constant folding optimisation pass
+def fold_constants(ast):
+    '''
+    Fold every BinOp/UnaryOp whose operands are all
+    IntNodes into a single IntNode (the tree is rewritten
+    in place)
+    
+    RETURN: (new root, number of nodes eliminated)
+    '''
+    if isinstance(ast, BinOp):
+        ast.left, left_count   = fold_constants(ast.left)
+        ast.right, right_count = fold_constants(ast.right)
+        eliminated = left_count + right_count
+        
+        # division by zero is left for run time to report
+        if (isinstance(ast.left, IntNode) and isinstance(ast.right, IntNode)
+                and not (ast.op.type == DIVIDE and ast.right.value == 0)):
+            return IntNode(Token(INTEGER, handle_binop(ast))), eliminated + 2
+        
+        return ast, eliminated
+    elif isinstance(ast, UnaryOp):
+        ast.expr, eliminated = fold_constants(ast.expr)
+        
+        if isinstance(ast.expr, IntNode):
+            return IntNode(Token(INTEGER, handle_unaryop(ast))), eliminated + 1
+        
+        return ast, eliminated
+    else:
+        return ast, 0
+
+# markers pushed on the work stack to apply an operator
+# once its operands have been evaluated
+
+class ApplyOp(object):
+    
+    __slots__ = ('func', 'arity')
+    
+    def __init__(self, func, arity):
+        self.func  = func
+        self.arity = arity
+
+BINARY_APPLY = {PLUS     : ApplyOp(operator.add, 2),
+                MINUS    : ApplyOp(operator.sub, 2),
+                MULTIPLY : ApplyOp(operator.mul, 2),
+                DIVIDE   : ApplyOp(operator.div, 2)}
+
+UNARY_APPLY = {PLUS  : ApplyOp(operator.pos, 1),
+               MINUS : ApplyOp(operator.neg, 1)}
+
+# non-recursive evaluation using an explicit work stack
+def eval_iterative(ast):
+    '''
+    Evaluate an AST without recursing, so arbitrarily deep
+    trees use bounded Python stack depth
+    
+    RETURN: value of the root expression (None for statements)
+    '''
+    if ast is None:
+        raise Exception("Invalid AST for input expression")
+    
+    values = []
+    push_value = values.append
+    pop_value  = values.pop
+    work = [ast]
+    push = work.append
+    pop  = work.pop
+    
+    while work:
+        
+        node = pop()
+        kind = type(node)
+        
+        if kind is BinOp:
+            apply = BINARY_APPLY.get(node.op.type)
+            if apply is None:
+                raise Exception("Unknown operator found")
+            push(apply)
+            push(node.right)
+            push(node.left)
+        elif kind is IntNode:
+            push_value(node.value)
+        elif kind is ApplyOp:
+            if node.arity == 2:
+                right = pop_value()
+                values[-1] = node.func(values[-1], right)
+            else:
+                values[-1] = node.func(values[-1])
+        elif kind is UnaryOp:
+            push(UNARY_APPLY[PLUS] if node.op.type == PLUS else UNARY_APPLY[MINUS])
+            push(node.expr)
+        else:
+            raise Exception("Invalid AST for input expression")
+    
+    return values[-1] if values else None
+
 def get_rpn(ast):
     if ast is None:
         raise Exception("Invalid AST for input expression")
@@ -171,13 +322,16 @@ def get_rpn(ast):
 
 class Interpreter(object):
     
-    def __init__(self, text):
+    def __init__(self, text, parser=None):
         # input expression
         self.text = text
         # pointer to current symbol
         self.pos  = 0
         # character being pointed at by 'pos' index
         self.curr_char = self.text[self.pos]
+        # expressions go through climb_expr unless asked for descent
+        if (parser or DEFAULT_PARSER) == CLIMBING_PARSER:
+            self.expr = self.climb_expr
         # most recent token available for processing
         self.curr_token = self.get_next_token()
         
@@ -238,37 +392,37 @@ class Interpreter(object):
             elif self.curr_char == '+':
             
                 self.advance()
-                return Token(PLUS, '+')
+                return FIXED_TOKENS[PLUS]
                 
             elif self.curr_char == '-':
             
                 self.advance()
-                return Token(MINUS, '-')
+                return FIXED_TOKENS[MINUS]
             
             elif self.curr_char == '*':
                 
                 self.advance()
-                return Token(MULTIPLY, '*')
+                return FIXED_TOKENS[MULTIPLY]
             
             elif self.curr_char == '/':
                 
                 self.advance()
-                return Token(DIVIDE, '/')
+                return FIXED_TOKENS[DIVIDE]
             
             elif self.curr_char == '(':
                 
                 self.advance()
-                return Token(LPAREN, '(')
+                return FIXED_TOKENS[LPAREN]
             
             elif self.curr_char == ')':
                 
                 self.advance()
-                return Token(RPAREN, ')')
+                return FIXED_TOKENS[RPAREN]
                 
             else:
                 self.error()
         
-        return Token(EOF, None)
+        return FIXED_TOKENS[EOF]
     
     def consume(self, type):
         '''
@@ -283,6 +437,86 @@ class Interpreter(object):
     
     ### PARSER CODE ###
     
+    def climb_expr(self):
+        '''
+        Precedence-climbing expression parser driven by
+        BINARY_PRECEDENCE; parentheses and unary operators
+        are kept on an explicit stack instead of recursing
+        
+        RETURN: same tree as the expr/term/factor rules
+        '''
+        operands   = []
+        # pending operator tokens and their precedence (or marker)
+        ops        = []
+        kinds      = []
+        depth      = 0
+        precedence_of = BINARY_PRECEDENCE.get
+        next_token    = self.get_next_token
+        token         = self.curr_token
+        
+        while True:
+            
+            # operand position
+            type = token.type
+            
+            if type == INTEGER:
+                operands.append(IntNode(token))
+            elif type == LPAREN:
+                ops.append(token)
+                kinds.append(PAREN)
+                depth += 1
+                token = self.curr_token = next_token()
+                continue
+            elif type in (PLUS, MINUS):
+                ops.append(UNARY_TOKENS[type])
+                kinds.append(UNARY)
+                token = self.curr_token = next_token()
+                continue
+            else:
+                self.error()
+            
+            token = self.curr_token = next_token()
+            
+            # operator position: close any finished groups first
+            while kinds and kinds[-1] == UNARY:
+                operands[-1] = UnaryOp(ops.pop(), operands[-1])
+                kinds.pop()
+            
+            while depth and token.type == RPAREN:
+                while kinds[-1] > PAREN:
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                ops.pop()
+                kinds.pop()
+                depth -= 1
+                token = self.curr_token = next_token()
+                while kinds and kinds[-1] == UNARY:
+                    operands[-1] = UnaryOp(ops.pop(), operands[-1])
+                    kinds.pop()
+            
+            precedence = precedence_of(token.type)
+            
+            if precedence is None:
+                while kinds:
+                    if kinds[-1] == PAREN:
+                        # an unclosed '(' is a missing RPAREN
+                        self.error()
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                return operands[-1]
+            
+            # reduce left-associative operators of equal or higher precedence
+            while kinds and kinds[-1] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                kinds.pop()
+            
+            ops.append(token)
+            kinds.append(precedence)
+            token = self.curr_token = next_token()
+    
     def expr(self):
         
         node = self.term()
@@ -332,10 +566,10 @@ class Interpreter(object):
             self.consume(RPAREN)
         elif self.curr_token.type == PLUS:
             self.consume(PLUS)
-            node = UnaryOp(Token(PLUS, 'PLUS'), self.factor())
+            node = UnaryOp(UNARY_TOKENS[PLUS], self.factor())
         elif self.curr_token.type == MINUS:
             self.consume(MINUS)
-            node = UnaryOp(Token(MINUS, 'MINUS'), self.factor())
+            node = UnaryOp(UNARY_TOKENS[MINUS], self.factor())
         else:
             #self.consume(INTEGER)
             node = IntNode(self.curr_token)
@@ -353,10 +587,267 @@ class Interpreter(object):
         #return get_rpn(ast)
     
 
+# Prepared expressions #
+
+# an expression's shape is its text with every literal replaced
+# by a placeholder and whitespace removed; expressions with the
+# same shape parse to the same tree
+LITERAL_REGEX    = re.compile(r'[0-9]+')
+WHITESPACE_REGEX = re.compile(r'\s+')
+PLACEHOLDER      = '#'
+
+# most templates kept by a TemplateCache
+DEFAULT_TEMPLATE_LIMIT = 4096
+
+def expression_shape(text):
+    '''
+    RETURN: (shape of text, list of its integer literals)
+    '''
+    shape    = WHITESPACE_REGEX.sub('', LITERAL_REGEX.sub(PLACEHOLDER, text))
+    literals = [int(literal) for literal in LITERAL_REGEX.findall(text)]
+    
+    return shape, literals
+
+def compile_template(ast, params):
+    '''
+    Turn an AST into a closure over a list of literals; each
+    IntNode leaf becomes a parameter slot, numbered in source
+    order and appended to params
+    '''
+    if isinstance(ast, BinOp):
+        apply = BINARY_APPLY.get(ast.op.type)
+        if apply is None:
+            raise Exception("Unknown operator found")
+        op    = apply.func
+        left  = compile_template(ast.left, params)
+        right = compile_template(ast.right, params)
+        return lambda literals: op(left(literals), right(literals))
+    elif isinstance(ast, UnaryOp):
+        expr = compile_template(ast.expr, params)
+        if ast.op.type == PLUS:
+            return lambda literals: +expr(literals)
+        else:
+            return lambda literals: -expr(literals)
+    elif isinstance(ast, IntNode):
+        slot = len(params)
+        params.append(ast)
+        return lambda literals: literals[slot]
+    else:
+        raise Exception("Invalid AST for input expression")
+
+class PreparedExpression(object):
+    '''
+    An expression parsed once into a template; eval() takes
+    the literals of any expression with the same shape
+    '''
+    def __init__(self, text):
+        shape, literals = expression_shape(text)
+        self.shape  = shape
+        # literals in the source text (trailing ones may be unused)
+        self.count  = len(literals)
+        self.params = []
+        self.code   = compile_template(Interpreter(text).expr(), self.params)
+    
+    def eval(self, literals):
+        '''
+        RETURN: same value as Interpreter(text).eval() for the
+                expression with these literals
+        '''
+        return self.code(literals)
+
+class TemplateCache(object):
+    '''
+    PreparedExpressions keyed by shape, with hit/miss counters;
+    once limit templates are held new shapes are not cached
+    '''
+    def __init__(self, limit=DEFAULT_TEMPLATE_LIMIT):
+        self.templates = {}
+        self.limit     = limit
+        self.hits      = 0
+        self.misses    = 0
+    
+    def eval(self, text):
+        '''
+        Evaluate text, parsing it only if its shape is new
+        '''
+        shape, literals = expression_shape(text)
+        template = self.templates.get(shape)
+        
+        if template is not None and template.count == len(literals):
+            self.hits += 1
+            return template.eval(literals)
+        
+        self.misses += 1
+        template = PreparedExpression(text)
+        
+        # placeholders already in the text give a shape whose
+        # literal count does not match; never cache those
+        if template.count == shape.count(PLACEHOLDER) and len(self.templates) < self.limit:
+            self.templates[shape] = template
+        
+        return template.eval(literals)
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+    
+    def stats(self):
+        return {'hits'      : self.hits,
+                'misses'    : self.misses,
+                'templates' : len(self.templates),
+                'hit_rate'  : self.hit_rate()}
+
+# process-wide cache used by batch and pipe mode
+PREPARED = TemplateCache()
+
+
+# Batch evaluation #
+
+DEFAULT_CHUNK_SIZE = 10000
+
+def eval_line(text):
+    '''
+    Evaluate one expression; errors become an 'Error: ...' result
+    '''
+    try:
+        return PREPARED.eval(text)
+    except Exception as e:
+        return 'Error: %s' % e
+
+def eval_chunk(lines):
+    '''
+    Worker task; RETURN: (results, seconds spent)
+    '''
+    start   = time.time()
+    results = [eval_line(line) for line in lines]
+    
+    return results, time.time() - start
+
+def chunked(lines, chunk_size):
+    '''
+    Group non-empty, stripped lines into lists of chunk_size
+    '''
+    lines = (line.strip() for line in lines)
+    lines = (line for line in lines if line)
+    
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def eval_batch(lines, processes=None, chunk_size=DEFAULT_CHUNK_SIZE, report=None):
+    '''
+    Evaluate expressions across a process pool
+    
+    YIELD: results in input order; report(index, count, seconds)
+           is called once per finished chunk when given
+    '''
+    chunks = chunked(lines, chunk_size)
+    pool   = None
+    
+    if processes == 1:
+        finished = itertools.imap(eval_chunk, chunks)
+    else:
+        pool     = multiprocessing.Pool(processes)
+        finished = pool.imap(eval_chunk, chunks)
+    
+    try:
+        for index, (results, seconds) in enumerate(finished):
+            if report is not None:
+                report(index, len(results), seconds)
+            for result in results:
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def report_chunk(index, count, seconds):
+    
+    rate = count / seconds if seconds else float('inf')
+    print >> sys.stderr, 'chunk %d: %d expressions in %.3fs (%.0f expr/s)' % (index, count, seconds, rate)
+
+def batch_main(args):
+    '''
+    calc6.py --batch [-j PROCESSES] [-c CHUNK_SIZE] [FILE]
+    
+    Reads expressions from FILE (default: stdin), one per line
+    '''
+    processes  = None
+    chunk_size = DEFAULT_CHUNK_SIZE
+    path       = '-'
+    
+    while args:
+        arg = args.pop(0)
+        if arg == '-j':
+            processes = int(args.pop(0))
+        elif arg == '-c':
+            chunk_size = int(args.pop(0))
+        else:
+            path = arg
+    
+    source = sys.stdin if path == '-' else open(path)
+    out    = sys.stdout
+    
+    for result in eval_batch(source, processes, chunk_size, report_chunk):
+        out.write('%s\n' % result)
+    
+    out.flush()
+
+
+# Pipe mode #
+
+# bytes of input read per block, results written per flush
+PIPE_BLOCK_SIZE  = 1 << 20
+PIPE_FLUSH_LINES = 4096
+
+def pipe_main(stdin=None, stdout=None):
+    '''
+    Non-interactive mode for piped input: no prompts, input
+    read in large blocks and results written in batches
+    '''
+    stdin   = stdin or sys.stdin
+    stdout  = stdout or sys.stdout
+    results = []
+    
+    try:
+        while True:
+            
+            lines = stdin.readlines(PIPE_BLOCK_SIZE)
+            
+            if not lines:
+                break
+            
+            for line in lines:
+                
+                line = line.rstrip('\n')
+                
+                # ignore any empty lines of input
+                if not line:
+                    continue
+                
+                results.append('%s\n' % PREPARED.eval(line))
+                
+                if len(results) >= PIPE_FLUSH_LINES:
+                    stdout.write(''.join(results))
+                    del results[:]
+    finally:
+        stdout.write(''.join(results))
+        stdout.flush()
+
+
 def main():
     '''
     Main logic for presenting CLI to user of interpreter
     '''
+    if sys.argv[1:2] == ['--batch']:
+        batch_main(sys.argv[2:])
+        return
+    
+    if not sys.stdin.isatty():
+        pipe_main()
+        return
+    
     while True:
 
         try:
@@ -10,7 +10,14 @@ Inspired by tutorial from Ruslan Spivak
 Author: GotoCode
 '''
 
+import json
+import mmap
+import operator
+import os
+import re
 import sys
+import time
+from array import array
 
 
 # Token Types
@@ -33,6 +40,53 @@ ID     = 'ID'
 DOT    = 'DOT'
 SEMI   = 'SEMI'
 
+# Lexer selection
+
+REGEX_LEXER    = 'regex'
+CHAR_LEXER     = 'char'
+COLUMNAR_LEXER = 'columnar'
+
+DEFAULT_LEXER = REGEX_LEXER
+
+# Parser selection
+
+CLIMBING_PARSER = 'climbing'
+DESCENT_PARSER  = 'descent'
+
+DEFAULT_PARSER = CLIMBING_PARSER
+
+# operator table for the precedence-climbing parser
+BINARY_PRECEDENCE = {PLUS     : 1,
+                     MINUS    : 1,
+                     MULTIPLY : 2,
+                     DIVIDE   : 2}
+
+# operator stack markers (below every binary precedence)
+PAREN = 0
+UNARY = -1
+
+# master regex for the single-pass lexer; alternatives are
+# ordered exactly like the branches of get_next_token so
+# both lexers emit the same token stream
+
+WHITESPACE = 'WHITESPACE'
+
+TOKEN_REGEX = re.compile(r'''
+      (?P<WHITESPACE>\s+)
+    | (?P<ASSIGN>:=)
+    | (?P<DOT>\.)
+    | (?P<SEMI>;)
+    | (?P<INTEGER>\d+)
+    | (?P<PLUS>\+)
+    | (?P<MINUS>-)
+    | (?P<MULTIPLY>\*)
+    | (?P<DIVIDE>div)
+    | (?P<LPAREN>\()
+    | (?P<RPAREN>\))
+    | (?P<ID>[A-Za-z_]\w*)
+''', re.VERBOSE)
+
+
 # global symbol table
 
 GLOBAL_SCOPE = {}
@@ -42,6 +96,8 @@ GLOBAL_SCOPE = {}
 
 class Token(object):
     
+    __slots__ = ('type', 'value')
+    
     def __init__(self, type, value):
         self.type  = type
         self.value = value
@@ -53,13 +109,169 @@ class Token(object):
         return self.__str__()
 
 
+# A FixedToken is shared by every occurrence of its lexeme,
+# so it must never be modified once built
+
+class FixedToken(Token):
+    
+    __slots__ = ()
+    
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('FixedToken is immutable')
+    
+    def __reduce__(self):
+        # unpickle back to the shared instance
+        return (shared_token, (self.type, self.value))
+
+
+# Flyweight tables of fixed-value tokens
+
+FIXED_TOKENS = {ASSIGN   : FixedToken(ASSIGN, ':='),
+                DOT      : FixedToken(DOT, '.'),
+                SEMI     : FixedToken(SEMI, ';'),
+                PLUS     : FixedToken(PLUS, '+'),
+                MINUS    : FixedToken(MINUS, '-'),
+                MULTIPLY : FixedToken(MULTIPLY, '*'),
+                DIVIDE   : FixedToken(DIVIDE, '/'),
+                LPAREN   : FixedToken(LPAREN, '('),
+                RPAREN   : FixedToken(RPAREN, ')'),
+                EOF      : FixedToken(EOF, None)}
+
+RESERVED_KEYWORDS = {'BEGIN' : FixedToken(BEGIN, 'BEGIN'),
+                     'END'   : FixedToken(END, 'END')}
+
+# operator tokens attached to UnaryOp nodes
+UNARY_TOKENS = {PLUS  : FixedToken(PLUS, 'PLUS'),
+                MINUS : FixedToken(MINUS, 'MINUS')}
+
+def shared_token(type, value):
+    '''
+    RETURN: the table instance of a fixed-value token
+    '''
+    for table in (FIXED_TOKENS, RESERVED_KEYWORDS, UNARY_TOKENS):
+        token = table.get(type)
+        if token is not None and token.value == value:
+            return token
+    
+    raise KeyError((type, value))
+
+
+# Columnar token stream #
+
+# small-integer type codes (index into TOKEN_TYPES)
+TOKEN_TYPES = (INTEGER, PLUS, MINUS, MULTIPLY, DIVIDE, LPAREN, RPAREN,
+               EOF, BEGIN, END, ASSIGN, ID, DOT, SEMI)
+TOKEN_CODES = dict((type, code) for code, type in enumerate(TOKEN_TYPES))
+
+class TokenColumns(object):
+    '''
+    Compact token stream: one type code plus start/end
+    source offsets per token, held in parallel arrays;
+    token values are only built when asked for
+    '''
+    def __init__(self, text):
+        self.text   = text
+        self.types  = array('B')
+        self.starts = array('I')
+        self.ends   = array('I')
+        self.scan()
+    
+    def __len__(self):
+        return len(self.types)
+    
+    def scan(self):
+        '''
+        Fill the columns in one pass over the source
+        '''
+        text   = self.text
+        types  = self.types
+        starts = self.starts
+        ends   = self.ends
+        codes  = TOKEN_CODES
+        pos    = 0
+        match  = TOKEN_REGEX.match(text, pos)
+        
+        while match is not None:
+            
+            kind = match.lastgroup
+            
+            if kind != WHITESPACE:
+                if kind == ID:
+                    keyword = RESERVED_KEYWORDS.get(match.group().upper())
+                    if keyword is not None:
+                        kind = keyword.type
+                types.append(codes[kind])
+                starts.append(pos)
+                ends.append(match.end())
+            
+            pos   = match.end()
+            match = TOKEN_REGEX.match(text, pos)
+        
+        if pos < len(text):
+            line, column = line_col(text, pos)
+            raise Exception('Error parsing input... (line %d, column %d)' % (line, column))
+        
+        types.append(codes[EOF])
+        starts.append(pos)
+        ends.append(pos)
+    
+    def value(self, index):
+        '''
+        Materialise the value of the token at index
+        '''
+        type = TOKEN_TYPES[self.types[index]]
+        
+        if type == INTEGER:
+            return int(self.text[self.starts[index]:self.ends[index]])
+        elif type == ID:
+            return self.text[self.starts[index]:self.ends[index]].lower()
+        elif type in (BEGIN, END):
+            return type
+        else:
+            return FIXED_TOKENS[type].value
+    
+    def token(self, index):
+        '''
+        Materialise the token at index (shared for fixed tokens)
+        '''
+        type = TOKEN_TYPES[self.types[index]]
+        
+        if type in (INTEGER, ID):
+            return Token(type, self.value(index))
+        elif type in (BEGIN, END):
+            return RESERVED_KEYWORDS[type]
+        else:
+            return FIXED_TOKENS[type]
+    
+    def nbytes(self):
+        '''
+        Memory held by the three columns, in bytes
+        '''
+        return sum(column.itemsize * len(column)
+                   for column in (self.types, self.starts, self.ends))
+
+
 # Abstract Syntax Tree #
 
+# Nodes built by the parser carry the 1-based source line and
+# column where they start (None for nodes made any other way);
+# a BinOp or Assign starts where its left operand does
+
 class BinOp(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self, left, op, right):
         self.left  = left
         self.op    = op
         self.right = right
+        self.line  = left.line
+        self.column = left.column
     
     def __str__(self):
         return 'BinOp({left}, {op}, {right})'.format(left=str(self.left), 
@@ -67,6 +279,10 @@ class BinOp(object):
                                                      right=str(self.right))
 
 class IntNode(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self, token):
         self.token = token
         self.value = token.value
@@ -75,6 +291,10 @@ class IntNode(object):
         return 'IntNode(%d)' % self.value
 
 class UnaryOp(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self, op, expr):
         self.op   = op
         self.expr = expr
@@ -83,16 +303,30 @@ class UnaryOp(object):
         return 'UnaryOp({op}, {expr})'.format(op=self.op.type, expr=str(self.expr))
 
 class CompoundNode(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self):
         self.children = []
 
 class Assign(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.line = left.line
+        self.column = left.column
 
 class Var(object):
+    
+    line   = None
+    column = None
+    
     def __init__(self, token):
         self.token = token
         self.value = token.value
@@ -164,23 +398,615 @@ def eval_AST(ast):
                 return value
 
 
+# Evaluation profiling #
+
+# the uninstrumented evaluator, put back by disable_profiling
+plain_eval_AST = eval_AST
+
+# profile being filled while profiling is enabled
+PROFILE = None
+
+class EvalProfile(object):
+    '''
+    Visit counts and times per node type and operator
+
+    Self time excludes the time spent evaluating child
+    nodes, total time includes it (so nested nodes of one
+    type are counted more than once); both include the
+    timer's own overhead
+    '''
+    def __init__(self):
+        # (node type, operator or None) -> [visits, self seconds, total seconds]
+        self.stats   = {}
+        # child time accumulated by each active eval_AST call
+        self.frames  = []
+        # time spent in outermost eval_AST calls
+        self.seconds = 0.0
+    
+    def eval(self, ast):
+        '''
+        eval_AST with accounting; recursive calls come back
+        through here because they look eval_AST up globally
+        '''
+        frames = self.frames
+        kind   = type(ast)
+        
+        if kind is BinOp or kind is UnaryOp:
+            key = (kind.__name__, ast.op.type)
+        else:
+            key = (kind.__name__, None)
+        
+        frames.append(0.0)
+        start = time.time()
+        
+        try:
+            return plain_eval_AST(ast)
+        finally:
+            elapsed = time.time() - start
+            self.record(key, elapsed - frames.pop(), elapsed)
+            if frames:
+                frames[-1] += elapsed
+            else:
+                self.seconds += elapsed
+    
+    def record(self, key, own, elapsed):
+        
+        entry = self.stats.get(key)
+        
+        if entry is None:
+            entry = self.stats[key] = [0, 0.0, 0.0]
+        
+        entry[0] += 1
+        entry[1] += own
+        entry[2] += elapsed
+    
+    def rows(self, by_operator):
+        '''
+        RETURN: list of (name, visits, self seconds, total seconds),
+                most self time first
+        '''
+        totals = {}
+        
+        for (kind, op), (visits, own, elapsed) in self.stats.iteritems():
+            if by_operator:
+                if op is None:
+                    continue
+                name = '%s %s' % (kind, op)
+            else:
+                name = kind
+            entry = totals.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += visits
+            entry[1] += own
+            entry[2] += elapsed
+        
+        rows = [(label,) + tuple(counts) for label, counts in totals.iteritems()]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        
+        return rows
+    
+    def export(self):
+        '''
+        RETURN: dict of the totals (see to_json)
+        '''
+        def section(by_operator):
+            return dict((name, {'visits'        : visits,
+                                'self_seconds'  : own,
+                                'total_seconds' : elapsed})
+                        for name, visits, own, elapsed in self.rows(by_operator))
+        
+        return {'seconds'   : self.seconds,
+                'nodes'     : section(False),
+                'operators' : section(True)}
+    
+    def to_json(self):
+        return json.dumps(self.export(), indent=2, sort_keys=True)
+    
+    def table(self):
+        '''
+        RETURN: the totals as a text table
+        '''
+        lines = ['%-20s %10s %10s %10s %7s' % ('node', 'visits', 'self s', 'total s', 'self %')]
+        
+        for by_operator in (False, True):
+            lines.append('')
+            for name, visits, own, elapsed in self.rows(by_operator):
+                share = 100.0 * own / self.seconds if self.seconds else 0.0
+                lines.append('%-20s %10d %10.4f %10.4f %6.1f%%' % (name, visits, own, elapsed, share))
+        
+        lines.append('')
+        lines.append('%-20s %10s %10.4f' % ('total', '', self.seconds))
+        
+        return '\n'.join(lines)
+
+class SourceProfile(object):
+    '''
+    Times per source line and per BEGIN ... END block
+
+    A frame is opened for every block, every assignment and
+    every continuation line of an expression split over
+    several lines; the other nodes are charged to the frame
+    they are evaluated in. Nodes without a position (such as
+    hand-built trees) open no frames
+    '''
+    def __init__(self):
+        # ';'-joined frame labels, outermost first -> self seconds
+        self.stacks  = {}
+        # line -> [visits, self seconds, total seconds]
+        self.lines   = {}
+        # [stack, line, child seconds] of each open frame
+        self.frames  = []
+        # time spent in outermost frames
+        self.seconds = 0.0
+    
+    def label(self, ast):
+        '''
+        RETURN: name of the frame ast opens, or None
+        '''
+        line = getattr(ast, 'line', None)
+        
+        if line is None:
+            return None
+        
+        kind = type(ast)
+        
+        if kind is CompoundNode:
+            return 'BEGIN line %d' % line
+        elif kind is Assign:
+            return '%s := line %d' % (ast.left.value, line)
+        elif self.frames and self.frames[-1][1] != line:
+            return 'line %d' % line
+        
+        return None
+    
+    def eval(self, ast):
+        '''
+        eval_AST with accounting (see EvalProfile.eval)
+        '''
+        label = self.label(ast)
+        
+        if label is None:
+            return plain_eval_AST(ast)
+        
+        frames = self.frames
+        stack  = frames[-1][0] + ';' + label if frames else label
+        frame  = [stack, ast.line, 0.0]
+        
+        frames.append(frame)
+        start = time.time()
+        
+        try:
+            return plain_eval_AST(ast)
+        finally:
+            elapsed = time.time() - start
+            own     = elapsed - frames.pop()[2]
+            
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+            
+            entry = self.lines.get(ast.line)
+            if entry is None:
+                entry = self.lines[ast.line] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += own
+            entry[2] += elapsed
+            
+            if frames:
+                frames[-1][2] += elapsed
+            else:
+                self.seconds += elapsed
+    
+    def collapsed(self):
+        '''
+        RETURN: the stacks in the collapsed format read by
+                flamegraph.pl and speedscope (microseconds)
+        '''
+        lines = []
+        
+        for stack in sorted(self.stacks):
+            micros = int(round(self.stacks[stack] * 1e6))
+            if micros:
+                lines.append('%s %d' % (stack, micros))
+        
+        return '\n'.join(lines)
+    
+    def table(self, text=None):
+        '''
+        RETURN: the per-line totals as a text table, with the
+                source line when text is given
+        '''
+        source = text[:].splitlines() if text is not None else []
+        lines  = ['%6s %10s %10s %10s %7s' % ('line', 'visits', 'self s', 'total s', 'self %')]
+        
+        for line in sorted(self.lines):
+            visits, own, elapsed = self.lines[line]
+            share = 100.0 * own / self.seconds if self.seconds else 0.0
+            row   = '%6d %10d %10.4f %10.4f %6.1f%%' % (line, visits, own, elapsed, share)
+            if line <= len(source):
+                row += '  ' + source[line - 1].strip()
+            lines.append(row)
+        
+        lines.append('')
+        lines.append('%6s %10s %10.4f' % ('total', '', self.seconds))
+        
+        return '\n'.join(lines)
+
+def enable_profiling(profile=None):
+    '''
+    Route eval_AST through a profiler, an EvalProfile by
+    default (disabled, eval_AST is the plain function and
+    costs nothing extra)
+    
+    RETURN: the profile being filled
+    '''
+    global eval_AST, PROFILE
+    
+    PROFILE  = profile or EvalProfile()
+    eval_AST = PROFILE.eval
+    
+    return PROFILE
+
+def disable_profiling():
+    '''
+    RETURN: the profile that was being filled
+    '''
+    global eval_AST
+    
+    eval_AST = plain_eval_AST
+    
+    return PROFILE
+
+
+# constant folding optimisation pass
+def fold_constants(ast):
+    '''
+    Fold every BinOp/UnaryOp whose operands are all
+    IntNodes into a single IntNode (the tree is rewritten
+    in place)
+    
+    RETURN: (new root, number of nodes eliminated)
+    '''
+    if isinstance(ast, BinOp):
+        ast.left, left_count   = fold_constants(ast.left)
+        ast.right, right_count = fold_constants(ast.right)
+        eliminated = left_count + right_count
+        
+        # division by zero is left for run time to report
+        if (isinstance(ast.left, IntNode) and isinstance(ast.right, IntNode)
+                and not (ast.op.type == DIVIDE and ast.right.value == 0)):
+            folded = IntNode(Token(INTEGER, handle_binop(ast)))
+            folded.line, folded.column = ast.line, ast.column
+            return folded, eliminated + 2
+        
+        return ast, eliminated
+    elif isinstance(ast, UnaryOp):
+        ast.expr, eliminated = fold_constants(ast.expr)
+        
+        if isinstance(ast.expr, IntNode):
+            folded = IntNode(Token(INTEGER, handle_unaryop(ast)))
+            folded.line, folded.column = ast.line, ast.column
+            return folded, eliminated + 1
+        
+        return ast, eliminated
+    elif isinstance(ast, Assign):
+        ast.right, eliminated = fold_constants(ast.right)
+        return ast, eliminated
+    elif isinstance(ast, CompoundNode):
+        eliminated = 0
+        for i, child in enumerate(ast.children):
+            ast.children[i], count = fold_constants(child)
+            eliminated += count
+        return ast, eliminated
+    else:
+        return ast, 0
+
+
+# markers pushed on the work stack to apply an operator
+# once its operands have been evaluated
+
+class ApplyOp(object):
+    
+    __slots__ = ('func', 'arity')
+    
+    def __init__(self, func, arity):
+        self.func  = func
+        self.arity = arity
+
+BINARY_APPLY = {PLUS     : ApplyOp(operator.add, 2),
+                MINUS    : ApplyOp(operator.sub, 2),
+                MULTIPLY : ApplyOp(operator.mul, 2),
+                DIVIDE   : ApplyOp(operator.div, 2)}
+
+UNARY_APPLY = {PLUS  : ApplyOp(operator.pos, 1),
+               MINUS : ApplyOp(operator.neg, 1)}
+
+# non-recursive evaluation using an explicit work stack
+def eval_iterative(ast):
+    '''
+    Evaluate an AST without recursing, so arbitrarily deep
+    trees use bounded Python stack depth
+    
+    RETURN: value of the root expression (None for statements)
+    '''
+    if ast is None:
+        raise Exception("Invalid AST for input expression")
+    
+    values = []
+    push_value = values.append
+    pop_value  = values.pop
+    work = [ast]
+    push = work.append
+    pop  = work.pop
+    
+    while work:
+        
+        node = pop()
+        kind = type(node)
+        
+        if kind is BinOp:
+            apply = BINARY_APPLY.get(node.op.type)
+            if apply is None:
+                raise Exception("Unknown operator found")
+            push(apply)
+            push(node.right)
+            push(node.left)
+        elif kind is IntNode:
+            push_value(node.value)
+        elif kind is ApplyOp:
+            if node.arity == 2:
+                right = pop_value()
+                values[-1] = node.func(values[-1], right)
+            else:
+                values[-1] = node.func(values[-1])
+        elif kind is Var:
+            value = GLOBAL_SCOPE.get(node.value.lower(), None)
+            if value is None:
+                raise NameError(str(node.value))
+            push_value(value)
+        elif kind is UnaryOp:
+            push(UNARY_APPLY[PLUS] if node.op.type == PLUS else UNARY_APPLY[MINUS])
+            push(node.expr)
+        elif kind is str:
+            # name of a variable waiting for its assigned value
+            GLOBAL_SCOPE[node] = pop_value()
+        elif kind is Assign:
+            push(node.left.value.lower())
+            push(node.right)
+        elif kind is CompoundNode:
+            work.extend(reversed(node.children))
+        elif kind is NoOp:
+            pass
+        else:
+            raise Exception("Invalid AST for input expression")
+    
+    return values[-1] if values else None
+
+
+# Slot-indexed evaluation #
+
+class SymbolTable(object):
+    '''
+    Interned variable names, each mapped to a fixed slot
+    in a flat list of values
+    '''
+    def __init__(self):
+        self.slots = {}
+        self.names = []
+    
+    def slot(self, name):
+        '''
+        Return the slot for name, assigning a new one on first use
+        '''
+        slot = self.slots.get(name)
+        
+        if slot is None:
+            slot = len(self.names)
+            self.names.append(intern(name))
+            self.slots[self.names[slot]] = slot
+        
+        return slot
+    
+    def new_slots(self):
+        return [None] * len(self.names)
+    
+    def export(self, slots, scope=None):
+        '''
+        Copy assigned slot values into a name -> value dict
+        (GLOBAL_SCOPE style); RETURN: that dict
+        '''
+        if scope is None:
+            scope = {}
+        
+        for name, value in zip(self.names, slots):
+            if value is not None:
+                scope[name] = value
+        
+        return scope
+
+def resolve_slots(ast, symbols=None):
+    '''
+    Resolution pass: give every Var node a 'slot' attribute
+    
+    RETURN: SymbolTable used for the resolution
+    '''
+    if symbols is None:
+        symbols = SymbolTable()
+    
+    stack = [ast]
+    
+    while stack:
+        node = stack.pop()
+        
+        if isinstance(node, Var):
+            node.slot = symbols.slot(node.value.lower())
+        elif isinstance(node, BinOp):
+            stack.append(node.right)
+            stack.append(node.left)
+        elif isinstance(node, UnaryOp):
+            stack.append(node.expr)
+        elif isinstance(node, Assign):
+            stack.append(node.right)
+            stack.append(node.left)
+        elif isinstance(node, CompoundNode):
+            stack.extend(reversed(node.children))
+    
+    return symbols
+
+def eval_slots(ast, slots):
+    '''
+    Evaluate a resolved AST against a flat list of slots
+    '''
+    if isinstance(ast, BinOp):
+        left_val  = eval_slots(ast.left, slots)
+        right_val = eval_slots(ast.right, slots)
+        op_type   = ast.op.type
+        if op_type == PLUS:
+            return left_val + right_val
+        elif op_type == MINUS:
+            return left_val - right_val
+        elif op_type == MULTIPLY:
+            return left_val * right_val
+        elif op_type == DIVIDE:
+            return left_val / right_val
+        else:
+            raise Exception("Unknown operator found")
+    elif isinstance(ast, Var):
+        value = slots[ast.slot]
+        if value is None:
+            raise NameError(str(ast.value))
+        return value
+    elif isinstance(ast, IntNode):
+        return ast.value
+    elif isinstance(ast, UnaryOp):
+        if ast.op.type == PLUS:
+            return +eval_slots(ast.expr, slots)
+        else:
+            return -eval_slots(ast.expr, slots)
+    elif isinstance(ast, Assign):
+        slots[ast.left.slot] = eval_slots(ast.right, slots)
+    elif isinstance(ast, CompoundNode):
+        for child in ast.children:
+            eval_slots(child, slots)
+    elif isinstance(ast, NoOp):
+        pass
+    else:
+        raise Exception("Invalid AST for input expression")
+
+
+
+# Closure compilation #
+
+# operator functions, resolved once at compile time
+BINARY_OPS = {PLUS     : operator.add,
+              MINUS    : operator.sub,
+              MULTIPLY : operator.mul,
+              DIVIDE   : operator.div}
+
+def compile_node(ast, ops=BINARY_OPS, negate=None):
+    '''
+    Turn a resolved AST node into a closure taking the slot list
+    
+    ops maps operator types to the functions applied to their
+    operands, negate (if given) replaces unary minus
+    '''
+    if isinstance(ast, BinOp):
+        if ast.op.type not in ops:
+            raise Exception("Unknown operator found")
+        op    = ops[ast.op.type]
+        left  = compile_node(ast.left, ops, negate)
+        right = compile_node(ast.right, ops, negate)
+        return lambda slots: op(left(slots), right(slots))
+    elif isinstance(ast, Var):
+        slot = ast.slot
+        name = str(ast.value)
+        def load(slots):
+            value = slots[slot]
+            if value is None:
+                raise NameError(name)
+            return value
+        return load
+    elif isinstance(ast, IntNode):
+        value = ast.value
+        return lambda slots: value
+    elif isinstance(ast, UnaryOp):
+        expr = compile_node(ast.expr, ops, negate)
+        if ast.op.type == PLUS:
+            return lambda slots: +expr(slots)
+        elif negate is None:
+            return lambda slots: -expr(slots)
+        else:
+            return lambda slots: negate(expr(slots))
+    elif isinstance(ast, Assign):
+        slot  = ast.left.slot
+        value = compile_node(ast.right, ops, negate)
+        def store(slots):
+            slots[slot] = value(slots)
+        return store
+    elif isinstance(ast, CompoundNode):
+        children = [compile_node(child, ops, negate) for child in ast.children
+                    if not isinstance(child, NoOp)]
+        def block(slots):
+            for child in children:
+                child(slots)
+        return block
+    elif isinstance(ast, NoOp):
+        return lambda slots: None
+    else:
+        raise Exception("Invalid AST for input expression")
+
+class CompiledProgram(object):
+    '''
+    A program compiled to pre-bound closures; run() may
+    be called any number of times
+    '''
+    def __init__(self, ast):
+        self.symbols = resolve_slots(ast)
+        self.code    = compile_node(ast)
+    
+    def run(self, scope=None):
+        '''
+        Execute on fresh slots; RETURN: name -> value dict
+        '''
+        slots = self.symbols.new_slots()
+        self.code(slots)
+        return self.symbols.export(slots, scope)
+
+
 # An Interpreter which converts a single-line
 # expression into a stream of tokens
 
 class Interpreter(object):
     
-    def __init__(self, text):
+    def __init__(self, text, lexer=None, parser=None):
         # input expression
         self.text = text
         # pointer to current symbol
         self.pos  = 0
         # character being pointed at by 'pos' index
         self.curr_char = self.text[self.pos]
+        # offset where the most recent token starts
+        self.start = 0
+        # line reached by where(), the offset that line starts
+        # at and how far the text has been searched for newlines
+        self.line       = 1
+        self.line_start = 0
+        self.line_scan  = 0
+        # swap in the requested lexer (char-by-char is get_next_token)
+        lexer = lexer or DEFAULT_LEXER
+        if lexer == REGEX_LEXER:
+            self.get_next_token = self.scan_next_token
+        elif lexer == COLUMNAR_LEXER:
+            # index of the next token to hand to the parser
+            self.index   = 0
+            self.columns = TokenColumns(self.text)
+            self.get_next_token = self.column_next_token
+        # expressions go through climb_expr unless asked for descent
+        if (parser or DEFAULT_PARSER) == CLIMBING_PARSER:
+            self.expr = self.climb_expr
         # most recent token available for processing
         self.curr_token = self.get_next_token()
         
     def error(self):
-        raise Exception('Error parsing input...')
+        line, column = line_col(self.text, self.pos)
+        raise Exception('Error parsing input... (line %d, column %d)' % (line, column))
     
     def advance(self):
         '''
@@ -228,15 +1054,18 @@ class Interpreter(object):
     # create token for variables and reserved keywords
     def _id(self):
     
-        RESERVED_KEYWORDS = {'BEGIN':Token('BEGIN', 'BEGIN'),
-                             'END':Token('END', 'END')}
         result = ''
         
         while self.curr_char != None and self.curr_char.isalnum() or self.curr_char == '_':
             result += self.curr_char
             self.advance()
-            
-        return RESERVED_KEYWORDS.get(result.upper(), Token(ID, result.lower()))
+        
+        keyword = RESERVED_KEYWORDS.get(result.upper())
+        
+        if keyword is not None:
+            return keyword
+        
+        return Token(ID, result.lower())
     
     def get_next_token(self):
         '''
@@ -247,21 +1076,23 @@ class Interpreter(object):
         '''
         while self.curr_char is not None:
             
+            self.start = self.pos
+            
             if self.curr_char == ':' and self.peek() == '=':
                 
                 self.advance()
                 self.advance()
-                return Token(ASSIGN, ':=')
+                return FIXED_TOKENS[ASSIGN]
             
             elif self.curr_char == '.':
                 
                 self.advance()
-                return Token(DOT, '.')
+                return FIXED_TOKENS[DOT]
             
             elif self.curr_char == ';':
                 
                 self.advance()
-                return Token(SEMI, ';')
+                return FIXED_TOKENS[SEMI]
             
             elif self.curr_char.isspace(): 
             
@@ -275,34 +1106,34 @@ class Interpreter(object):
             elif self.curr_char == '+':
             
                 self.advance()
-                return Token(PLUS, '+')
+                return FIXED_TOKENS[PLUS]
                 
             elif self.curr_char == '-':
             
                 self.advance()
-                return Token(MINUS, '-')
+                return FIXED_TOKENS[MINUS]
             
             elif self.curr_char == '*':
                 
                 self.advance()
-                return Token(MULTIPLY, '*')
+                return FIXED_TOKENS[MULTIPLY]
             
             elif self.text[self.pos:self.pos+3] == 'div':
                 
                 self.advance()
                 self.advance()
                 self.advance()
-                return Token(DIVIDE, '/')
+                return FIXED_TOKENS[DIVIDE]
             
             elif self.curr_char == '(':
                 
                 self.advance()
-                return Token(LPAREN, '(')
+                return FIXED_TOKENS[LPAREN]
             
             elif self.curr_char == ')':
                 
                 self.advance()
-                return Token(RPAREN, ')')
+                return FIXED_TOKENS[RPAREN]
             
             elif self.curr_char.isalpha() or self.curr_char == '_':
                 
@@ -311,7 +1142,86 @@ class Interpreter(object):
             else:
                 self.error()
         
-        return Token(EOF, None)
+        self.start = self.pos
+        
+        return FIXED_TOKENS[EOF]
+    
+    def scan_next_token(self):
+        '''
+        Single-pass lexical analyzer which matches one
+        token per call using the compiled TOKEN_REGEX
+        
+        RETURN: Token object (same stream as get_next_token)
+        '''
+        text  = self.text
+        pos   = self.pos
+        match = TOKEN_REGEX.match(text, pos)
+        
+        while match is not None:
+            
+            kind  = match.lastgroup
+            start = pos
+            pos   = match.end()
+            
+            if kind == WHITESPACE:
+                match = TOKEN_REGEX.match(text, pos)
+                continue
+            
+            self.start = start
+            self.pos   = pos
+            
+            if kind == INTEGER:
+                return Token(INTEGER, int(match.group()))
+            elif kind == ID:
+                word    = match.group()
+                keyword = RESERVED_KEYWORDS.get(word.upper())
+                if keyword is not None:
+                    return keyword
+                return Token(ID, word.lower())
+            else:
+                return FIXED_TOKENS[kind]
+        
+        self.start = self.pos = pos
+        
+        if pos < len(text):
+            self.error()
+        
+        return FIXED_TOKENS[EOF]
+    
+    def column_next_token(self):
+        '''
+        Hand out the next token of the columnar stream,
+        materialising it only now
+        
+        RETURN: Token object (same stream as get_next_token)
+        '''
+        index = self.index
+        
+        if index < len(self.columns.types) - 1:
+            self.index = index + 1
+        
+        self.start = self.columns.starts[index]
+        self.pos   = self.columns.ends[index]
+        
+        return self.columns.token(index)
+    
+    def where(self):
+        '''
+        RETURN: 1-based (line, column) where the current token
+                starts; tokens must be asked for in source order
+        '''
+        text  = self.text
+        start = self.start
+        nl    = text.find('\n', self.line_scan, start)
+        
+        while nl != -1:
+            self.line      += 1
+            self.line_start = nl + 1
+            nl = text.find('\n', nl + 1, start)
+        
+        self.line_scan = start
+        
+        return self.line, start - self.line_start + 1
     
     def consume(self, type):
         '''
@@ -326,6 +1236,98 @@ class Interpreter(object):
     
     ### PARSER CODE ###
     
+    def climb_expr(self):
+        '''
+        Precedence-climbing expression parser driven by
+        BINARY_PRECEDENCE; parentheses and unary operators
+        are kept on an explicit stack instead of recursing
+        
+        RETURN: same tree as the expr/term/factor rules
+        '''
+        operands   = []
+        # pending operator tokens and their precedence (or marker)
+        ops        = []
+        kinds      = []
+        # positions of the pending unary operators
+        signs      = []
+        depth      = 0
+        where      = self.where
+        precedence_of = BINARY_PRECEDENCE.get
+        next_token    = self.get_next_token
+        token         = self.curr_token
+        
+        while True:
+            
+            # operand position
+            type = token.type
+            
+            if type == INTEGER:
+                node = IntNode(token)
+                node.line, node.column = where()
+                operands.append(node)
+            elif type == ID:
+                node = Var(token)
+                node.line, node.column = where()
+                operands.append(node)
+            elif type == LPAREN:
+                ops.append(token)
+                kinds.append(PAREN)
+                depth += 1
+                token = self.curr_token = next_token()
+                continue
+            elif type in (PLUS, MINUS):
+                ops.append(UNARY_TOKENS[type])
+                kinds.append(UNARY)
+                signs.append(where())
+                token = self.curr_token = next_token()
+                continue
+            else:
+                self.error()
+            
+            token = self.curr_token = next_token()
+            
+            # operator position: close any finished groups first
+            while kinds and kinds[-1] == UNARY:
+                node = operands[-1] = UnaryOp(ops.pop(), operands[-1])
+                node.line, node.column = signs.pop()
+                kinds.pop()
+            
+            while depth and token.type == RPAREN:
+                while kinds[-1] > PAREN:
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                ops.pop()
+                kinds.pop()
+                depth -= 1
+                token = self.curr_token = next_token()
+                while kinds and kinds[-1] == UNARY:
+                    node = operands[-1] = UnaryOp(ops.pop(), operands[-1])
+                    node.line, node.column = signs.pop()
+                    kinds.pop()
+            
+            precedence = precedence_of(token.type)
+            
+            if precedence is None:
+                while kinds:
+                    if kinds[-1] == PAREN:
+                        # an unclosed '(' is a missing RPAREN
+                        self.error()
+                    right = operands.pop()
+                    operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                    kinds.pop()
+                return operands[-1]
+            
+            # reduce left-associative operators of equal or higher precedence
+            while kinds and kinds[-1] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinOp(operands[-1], ops.pop(), right)
+                kinds.pop()
+            
+            ops.append(token)
+            kinds.append(precedence)
+            token = self.curr_token = next_token()
+    
     def expr(self):
         
         node = self.term()
@@ -374,16 +1376,21 @@ class Interpreter(object):
             node = self.expr()
             self.consume(RPAREN)
         elif self.curr_token.type == PLUS:
+            position = self.where()
             self.consume(PLUS)
-            node = UnaryOp(Token(PLUS, 'PLUS'), self.factor())
+            node = UnaryOp(UNARY_TOKENS[PLUS], self.factor())
+            node.line, node.column = position
         elif self.curr_token.type == MINUS:
+            position = self.where()
             self.consume(MINUS)
-            node = UnaryOp(Token(MINUS, 'MINUS'), self.factor())
+            node = UnaryOp(UNARY_TOKENS[MINUS], self.factor())
+            node.line, node.column = position
         elif self.curr_token.type == ID:
             return self.variable()
         else:
             #self.consume(INTEGER)
             node = IntNode(self.curr_token)
+            node.line, node.column = self.where()
             self.consume(INTEGER)
         
         return node
@@ -397,8 +1404,10 @@ class Interpreter(object):
     def compound_statement(self):
         '''compound_statement : BEGIN statement_list END'''
         #print self.curr_token
+        position = self.where()
         self.consume(BEGIN)
         node = self.statement_list()
+        node.line, node.column = position
         self.consume(END)
         return node
     
@@ -445,6 +1454,7 @@ class Interpreter(object):
     def variable(self):
         '''variable : ID'''
         node = Var(self.curr_token)
+        node.line, node.column = self.where()
         self.consume(ID)
         return node
     
@@ -458,6 +1468,83 @@ class Interpreter(object):
         ast = self.program()
         eval_AST(ast)
     
+    def eval_slots(self):
+        '''
+        Evaluate using slot-indexed variable storage,
+        exporting the final values into GLOBAL_SCOPE
+        '''
+        ast     = self.program()
+        symbols = resolve_slots(ast)
+        slots   = symbols.new_slots()
+        eval_slots(ast, slots)
+        symbols.export(slots, GLOBAL_SCOPE)
+    
+    def statements(self):
+        '''
+        Parse the program one top-level statement at a time
+        
+        YIELD: AST of each statement of the outermost BEGIN ... END
+        '''
+        self.consume(BEGIN)
+        yield self.statement()
+        
+        while self.curr_token.type == SEMI:
+            self.consume(SEMI)
+            yield self.statement()
+        
+        self.consume(END)
+        self.consume(DOT)
+    
+    def eval_streaming(self):
+        '''
+        Execute each top-level statement as soon as it is
+        parsed, so only one statement's AST is alive at once
+        (a syntax error is reported after the statements
+        before it have run)
+        '''
+        for node in self.statements():
+            eval_AST(node)
+    
+    def compile(self):
+        '''
+        Parse the program and compile it to closures
+        
+        RETURN: CompiledProgram
+        '''
+        return CompiledProgram(self.program())
+    
+
+def load_source(filename):
+    '''
+    Memory-map a source file so the lexer can scan it
+    in place; byte offsets match the file on disk
+    
+    RETURN: mmap object (caller closes it) or '' for an empty file
+    '''
+    fp = open(filename, 'rb')
+    
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files cannot be mapped
+        return ''
+    finally:
+        fp.close()
+
+def line_col(text, offset):
+    '''
+    Convert a byte offset into a 1-based (line, column) pair
+    '''
+    line  = 1
+    start = 0
+    nl    = text.find('\n', start, offset)
+    
+    while nl != -1:
+        line += 1
+        start = nl + 1
+        nl    = text.find('\n', start, offset)
+    
+    return line, offset - start + 1
 
 def file_to_input(filename):
     
@@ -475,17 +1562,104 @@ def main():
     Main logic for presenting CLI to user of interpreter
     '''
     
+    if os.environ.get('PASCAL_AST_CACHE'):
+        # cached trees are built from the importable eval_pascal
+        # module, which is a separate copy when run as a script;
+        # run the whole CLI there so the tree, the evaluator and
+        # the profilers all share one set of AST classes
+        import eval_pascal
+        if eval_pascal.main is not main:
+            return eval_pascal.main()
+    
     GLOBAL_SCOPE.clear()
     
-    input_expr  = file_to_input(sys.argv[1])
+    args = sys.argv[1:]
+    # -s: run statements as they are parsed
+    streaming = '-s' in args
+    
+    if streaming:
+        args.remove('-s')
+    
+    # reuse parsed programs from an on-disk cache when configured
+    cache_dir = os.environ.get('PASCAL_AST_CACHE')
+    
+    if streaming and cache_dir:
+        # a cached program is loaded whole, never streamed
+        raise Exception("Streaming cannot be combined with PASCAL_AST_CACHE")
+    
+    # -p: print eval_AST counters and timings to stderr
+    profiling = '-p' in args
+    
+    if profiling:
+        args.remove('-p')
+    
+    # --profile-json FILE: write them to FILE as JSON
+    profile_path = None
+    
+    if '--profile-json' in args:
+        index = args.index('--profile-json')
+        profile_path = args[index + 1]
+        del args[index:index + 2]
+    
+    # -l: print times per source line to stderr
+    line_profiling = '-l' in args
+    
+    if line_profiling:
+        args.remove('-l')
+    
+    # --flamegraph FILE: write block/statement stacks to FILE
+    flamegraph_path = None
+    
+    if '--flamegraph' in args:
+        index = args.index('--flamegraph')
+        flamegraph_path = args[index + 1]
+        del args[index:index + 2]
+    
+    if (profiling or profile_path) and (line_profiling or flamegraph_path):
+        raise Exception("Node and source line profiling cannot be combined")
+    
+    if profiling or profile_path:
+        profile = EvalProfile()
+    elif line_profiling or flamegraph_path:
+        profile = SourceProfile()
+    else:
+        profile = None
+    
+    input_expr  = load_source(args[0])
     
     #input_expr = 'BEGIN x := 2; y := (x + 2) * 3 END.'
+    
+    try:
+        if profile is not None:
+            enable_profiling(profile)
+        
+        if cache_dir:
+            from pascal_cache import ASTCache
+            eval_AST(ASTCache(cache_dir).load_program(input_expr))
+        elif streaming:
+            Interpreter(input_expr).eval_streaming()
+        else:
+            interpreter = Interpreter(input_expr)
+            interpreter.eval()
         
-    interpreter = Interpreter(input_expr)
+        print GLOBAL_SCOPE
         
-    interpreter.eval()
+        if profiling:
+            print >> sys.stderr, profile.table()
+        
+        if line_profiling:
+            print >> sys.stderr, profile.table(input_expr)
+    finally:
+        if isinstance(input_expr, mmap.mmap):
+            input_expr.close()
+    
+    if profile_path:
+        with open(profile_path, 'w') as fp:
+            fp.write(profile.to_json() + '\n')
     
-    print GLOBAL_SCOPE
+    if flamegraph_path:
+        with open(flamegraph_path, 'w') as fp:
+            fp.write(profile.collapsed() + '\n')
 
 
 if __name__ == '__main__':
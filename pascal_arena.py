@@ -0,0 +1,211 @@
+'''
+Struct-of-arrays AST arena for eval_pascal programs
+
+Every node is an index into parallel typed arrays (kind,
+operator, left/right child, literal value) laid out in
+postorder, so a program can be evaluated with one linear
+scan and a value stack, without any per-node objects
+
+Author: GotoCode
+'''
+
+from array import array
+
+from eval_pascal import (BinOp, IntNode, UnaryOp, CompoundNode, Assign, Var, NoOp,
+                         PLUS, MINUS, MULTIPLY, DIVIDE, SymbolTable)
+
+
+# Node kinds
+
+K_INT      = 0
+K_CONST    = 1    # integer too big for the values array
+K_VAR      = 2
+K_BINOP    = 3
+K_UNARY    = 4
+K_ASSIGN   = 5
+K_COMPOUND = 6
+K_NOOP     = 7
+
+# Operator codes
+
+O_NONE = 0
+O_ADD  = 1
+O_SUB  = 2
+O_MUL  = 3
+O_DIV  = 4
+O_POS  = 5
+O_NEG  = 6
+
+BINARY_CODES = {PLUS     : O_ADD,
+                MINUS    : O_SUB,
+                MULTIPLY : O_MUL,
+                DIVIDE   : O_DIV}
+
+
+class ASTArena(object):
+    '''
+    Parallel arrays holding one program's nodes:
+
+        kinds[i]  node kind
+        ops[i]    operator code
+        left[i]   left child / slot / const index / children offset
+        right[i]  right child / expression / children count
+        values[i] integer literal
+    '''
+    def __init__(self):
+        self.kinds    = array('B')
+        self.ops      = array('B')
+        self.left     = array('i')
+        self.right    = array('i')
+        self.values   = array('l')
+        # child indices of compound nodes
+        self.children = array('i')
+        self.consts   = []
+        self.symbols  = SymbolTable()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, kind, op=O_NONE, left=-1, right=-1, value=0):
+        '''
+        Append a node; RETURN: its index
+        '''
+        index = len(self.kinds)
+
+        # first, so an OverflowError leaves the arena untouched
+        self.values.append(value)
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.left.append(left)
+        self.right.append(right)
+
+        return index
+
+    def nbytes(self):
+        '''
+        Memory held by the arrays, in bytes
+        '''
+        return sum(column.itemsize * len(column)
+                   for column in (self.kinds, self.ops, self.left, self.right,
+                                  self.values, self.children))
+
+
+def build_arena(ast):
+    '''
+    Flatten an AST into a new ASTArena (postorder)
+    '''
+    arena   = ASTArena()
+    symbols = arena.symbols
+    # indices of finished nodes, consumed by their parents
+    done    = []
+    stack   = [(ast, False)]
+
+    while stack:
+
+        node, expanded = stack.pop()
+        kind = type(node)
+
+        if kind is IntNode:
+            try:
+                done.append(arena.add(K_INT, value=node.value))
+            except OverflowError:
+                done.append(arena.add(K_CONST, left=len(arena.consts)))
+                arena.consts.append(node.value)
+        elif kind is Var:
+            done.append(arena.add(K_VAR, left=symbols.slot(node.value.lower())))
+        elif kind is NoOp:
+            done.append(arena.add(K_NOOP))
+        elif not expanded:
+            # visit the children first, then come back to this node
+            stack.append((node, True))
+            if kind is BinOp:
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+            elif kind is UnaryOp:
+                stack.append((node.expr, False))
+            elif kind is Assign:
+                stack.append((node.right, False))
+            elif kind is CompoundNode:
+                for child in reversed(node.children):
+                    stack.append((child, False))
+            else:
+                raise Exception("Invalid AST for input expression")
+        elif kind is BinOp:
+            if node.op.type not in BINARY_CODES:
+                raise Exception("Unknown operator found")
+            right = done.pop()
+            left  = done.pop()
+            done.append(arena.add(K_BINOP, BINARY_CODES[node.op.type], left, right))
+        elif kind is UnaryOp:
+            op = O_POS if node.op.type == PLUS else O_NEG
+            done.append(arena.add(K_UNARY, op, done.pop()))
+        elif kind is Assign:
+            slot = symbols.slot(node.left.value.lower())
+            done.append(arena.add(K_ASSIGN, left=slot, right=done.pop()))
+        elif kind is CompoundNode:
+            count  = len(node.children)
+            offset = len(arena.children)
+            arena.children.extend(done[len(done) - count:])
+            del done[len(done) - count:]
+            done.append(arena.add(K_COMPOUND, left=offset, right=count))
+
+    return arena
+
+
+def eval_arena(arena, slots=None):
+    '''
+    Evaluate the arena in one linear postorder scan
+
+    RETURN: the slot list after execution
+    '''
+    if slots is None:
+        slots = arena.symbols.new_slots()
+
+    kinds  = arena.kinds
+    ops    = arena.ops
+    left   = arena.left
+    values = arena.values
+    names  = arena.symbols.names
+    stack  = []
+    push   = stack.append
+    pop    = stack.pop
+
+    for i in xrange(len(kinds)):
+
+        kind = kinds[i]
+
+        if kind == K_INT:
+            push(values[i])
+        elif kind == K_VAR:
+            value = slots[left[i]]
+            if value is None:
+                raise NameError(names[left[i]])
+            push(value)
+        elif kind == K_BINOP:
+            right = pop()
+            op    = ops[i]
+            if op == O_ADD:
+                stack[-1] = stack[-1] + right
+            elif op == O_SUB:
+                stack[-1] = stack[-1] - right
+            elif op == O_MUL:
+                stack[-1] = stack[-1] * right
+            else:
+                stack[-1] = stack[-1] / right
+        elif kind == K_ASSIGN:
+            slots[left[i]] = pop()
+        elif kind == K_UNARY:
+            if ops[i] == O_NEG:
+                stack[-1] = -stack[-1]
+            else:
+                stack[-1] = +stack[-1]
+        elif kind == K_CONST:
+            push(arena.consts[left[i]])
+
+    return slots
+
+def run(arena, scope=None):
+    '''
+    Execute on fresh slots; RETURN: name -> value dict
+    '''
+    return arena.symbols.export(eval_arena(arena), scope)
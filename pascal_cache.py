@@ -0,0 +1,306 @@
+'''
+Caches of parsed eval_pascal programs
+
+ASTCache is content-addressed and on disk: entries are keyed
+by a hash of the cache version and the source text, hold the
+parsed and constant-folded AST, and are evicted least-recently-
+used first once the directory grows past its size cap
+
+ProgramCache is the in-memory, process-wide counterpart: it
+holds ready-to-run CompiledPrograms, bounded by entry count
+and estimated memory, and may be shared between threads
+
+usage: python pascal_cache.py cache_dir program.pas
+
+Author: GotoCode
+'''
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+from eval_pascal import (BinOp, UnaryOp, CompoundNode, Assign,
+                         GLOBAL_SCOPE, Interpreter, CompiledProgram,
+                         eval_AST, fold_constants, load_source)
+from pascal_serialize import dumps, loads
+
+
+# bump whenever the AST classes or the parser output change
+CACHE_VERSION = '4'
+
+ENTRY_SUFFIX = '.ast'
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# in-memory cache limits
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_MEMORY  = 256 * 1024 * 1024
+
+# measured footprint of one compiled AST node (closure,
+# cells and bound values) on 64-bit CPython 2.7
+ESTIMATED_NODE_BYTES = 320
+
+
+class ASTCache(object):
+    '''
+    Directory of serialised ASTs with hit/miss counters
+    and an LRU size cap (recency is the entry's mtime)
+    '''
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, source):
+        '''
+        RETURN: hex digest identifying this source text
+        '''
+        digest = hashlib.sha1(CACHE_VERSION + '\0')
+        digest.update(source)
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, source):
+        '''
+        RETURN: cached AST for source, or None on a miss
+        '''
+        path = self.path(self.key(source))
+
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+
+        try:
+            ast = loads(fp.read())
+        except ValueError:
+            # truncated or stale entry - treat as a miss
+            fp.close()
+            self.discard(path)
+            self.misses += 1
+            return None
+
+        fp.close()
+        # mark as most recently used
+        os.utime(path, None)
+        self.hits += 1
+
+        return ast
+
+    def put(self, source, ast):
+        '''
+        Store the AST for source, then enforce the size cap
+        '''
+        data = dumps(ast)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+
+        os.rename(tmp_path, self.path(self.key(source)))
+        self.evict()
+
+    def load_program(self, source):
+        '''
+        RETURN: parsed, constant-folded AST for source,
+                from the cache when the source is unchanged
+        '''
+        ast = self.get(source)
+
+        if ast is None:
+            ast, _ = fold_constants(Interpreter(source).program())
+            self.put(source, ast)
+
+        return ast
+
+    def entries(self):
+        '''
+        RETURN: list of (mtime, size, path), oldest first
+        '''
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        '''
+        Remove least recently used entries until under max_bytes
+        '''
+        entries = self.entries()
+        total   = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            self.evictions += 1
+            total -= size
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'hits'      : self.hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions,
+                'bytes'     : self.size()}
+
+
+def count_nodes(ast):
+    '''
+    RETURN: number of nodes in ast
+    '''
+    count = 0
+    stack = [ast]
+
+    while stack:
+        node = stack.pop()
+        count += 1
+
+        if isinstance(node, BinOp):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, UnaryOp):
+            stack.append(node.expr)
+        elif isinstance(node, Assign):
+            stack.append(node.right)
+        elif isinstance(node, CompoundNode):
+            stack.extend(node.children)
+
+    return count
+
+
+class ProgramCache(object):
+    '''
+    Thread-safe in-memory LRU cache mapping source text to
+    its CompiledProgram, bounded by entry count and by the
+    estimated memory of the programs it holds
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_MEMORY):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        # key -> (program, estimated bytes), least recently used first
+        self.programs    = OrderedDict()
+        self.bytes       = 0
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.lock        = threading.Lock()
+
+    def key(self, source):
+        '''
+        RETURN: digest identifying this source text
+        '''
+        return hashlib.sha1(source).digest()
+
+    def get(self, source):
+        '''
+        RETURN: CompiledProgram for source, compiling it on a miss
+        '''
+        key = self.key(source)
+
+        with self.lock:
+            entry = self.programs.pop(key, None)
+            if entry is not None:
+                # re-insert as most recently used
+                self.programs[key] = entry
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # compile without holding the lock; if another thread
+        # finished the same source first, keep its program
+        ast, _  = fold_constants(Interpreter(source).program())
+        program = CompiledProgram(ast)
+        size    = len(source) + count_nodes(ast) * ESTIMATED_NODE_BYTES
+
+        with self.lock:
+            entry = self.programs.get(key)
+            if entry is not None:
+                return entry[0]
+            # programs bigger than the whole cache are not kept
+            if size <= self.max_bytes and self.max_entries > 0:
+                self.programs[key] = (program, size)
+                self.bytes += size
+                self.evict()
+
+        return program
+
+    def run(self, source, scope=None):
+        '''
+        Execute source on fresh slots; RETURN: name -> value dict
+        '''
+        return self.get(source).run(scope)
+
+    def evict(self):
+        '''
+        Drop least recently used programs until within both
+        limits (the caller holds the lock)
+        '''
+        while self.programs and (len(self.programs) > self.max_entries
+                                 or self.bytes > self.max_bytes):
+            _, (_, size) = self.programs.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.programs.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.programs)
+
+    def stats(self):
+        with self.lock:
+            return {'hits'      : self.hits,
+                    'misses'    : self.misses,
+                    'evictions' : self.evictions,
+                    'entries'   : len(self.programs),
+                    'bytes'     : self.bytes}
+
+
+def main():
+    '''
+    Run a Pascal file through the cache and report cache stats
+    '''
+    cache  = ASTCache(sys.argv[1])
+    source = load_source(sys.argv[2])
+
+    GLOBAL_SCOPE.clear()
+    eval_AST(cache.load_program(source))
+
+    print GLOBAL_SCOPE
+    print >> sys.stderr, 'cache:', cache.stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+'''
+Hash-consed expression DAG with common subexpression
+elimination for eval_pascal programs
+
+Structurally identical BinOp/UnaryOp/Var/IntNode subtrees
+are merged into one shared node. When the DAG is run, each
+shared expression is computed once and its value reused
+until one of the variables it reads is assigned again
+
+Author: GotoCode
+'''
+
+from eval_pascal import (BinOp, IntNode, UnaryOp, CompoundNode, Assign, Var, NoOp,
+                         PLUS, BINARY_OPS, GLOBAL_SCOPE)
+
+
+NO_DEPS = frozenset()
+
+
+class ExpressionDAG(object):
+    '''
+    A program whose expressions have been hash-consed
+    (the tree is rewritten in place to point at the
+    shared nodes, so eval_AST can still run it)
+    '''
+    def __init__(self, ast):
+        # structural key -> canonical node
+        self.table = {}
+        # id(canonical node) -> number of references to it
+        self.uses  = {}
+        # id(canonical node) -> names of the variables it reads
+        self.deps  = {}
+        # nodes that were replaced by an existing canonical node
+        self.eliminated = 0
+        self.root  = self.share(ast)
+        # only compound expressions used more than once are memoised
+        self.shared = set(key for key, count in self.uses.iteritems() if count > 1)
+        self.hits   = 0
+
+    def intern(self, key, node, deps):
+        '''
+        RETURN: the canonical node for key (node itself if new)
+        '''
+        canonical = self.table.get(key)
+
+        if canonical is None:
+            canonical = self.table[key] = node
+            self.deps[id(node)] = deps
+        else:
+            self.eliminated += 1
+
+        return canonical
+
+    def use(self, node):
+        if type(node) in (BinOp, UnaryOp):
+            self.uses[id(node)] = self.uses.get(id(node), 0) + 1
+
+    def share(self, node):
+        '''
+        Hash-cons node bottom-up; RETURN: its canonical node
+        '''
+        kind = type(node)
+
+        if kind is IntNode:
+            return self.intern(('int', node.value), node, NO_DEPS)
+        elif kind is Var:
+            name = node.value.lower()
+            return self.intern(('var', name), node, frozenset([name]))
+        elif kind is BinOp:
+            node.left  = self.share(node.left)
+            node.right = self.share(node.right)
+            key = ('bin', node.op.type, id(node.left), id(node.right))
+            canonical = self.intern(key, node, self.deps[id(node.left)] | self.deps[id(node.right)])
+            # only a node that stays in the DAG references its children
+            if canonical is node:
+                self.use(node.left)
+                self.use(node.right)
+            return canonical
+        elif kind is UnaryOp:
+            node.expr = self.share(node.expr)
+            key = ('un', node.op.type == PLUS, id(node.expr))
+            canonical = self.intern(key, node, self.deps[id(node.expr)])
+            if canonical is node:
+                self.use(node.expr)
+            return canonical
+        elif kind is Assign:
+            node.right = self.share(node.right)
+            self.use(node.right)
+            return node
+        elif kind is CompoundNode:
+            node.children = [self.share(child) for child in node.children]
+            return node
+        elif kind is NoOp:
+            return node
+        else:
+            raise Exception("Invalid AST for input expression")
+
+    def run(self, scope=None):
+        '''
+        Execute the program, storing variables in scope
+        (GLOBAL_SCOPE by default); RETURN: scope
+        '''
+        if scope is None:
+            scope = GLOBAL_SCOPE
+
+        self.scope = scope
+        # id(node) -> value valid in the current assignment window
+        self.memo  = {}
+        # variable name -> memoised node ids that read it
+        self.watch = {}
+        self.execute(self.root)
+
+        return scope
+
+    def execute(self, node):
+
+        kind = type(node)
+
+        if kind is Assign:
+            name = node.left.value.lower()
+            self.scope[name] = self.evaluate(node.right)
+            # values that read this variable are now stale
+            for key in self.watch.pop(name, ()):
+                self.memo.pop(key, None)
+        elif kind is CompoundNode:
+            for child in node.children:
+                self.execute(child)
+        elif kind is NoOp:
+            pass
+        else:
+            raise Exception("Invalid AST for input expression")
+
+    def evaluate(self, node):
+
+        key = id(node)
+
+        if key in self.memo:
+            self.hits += 1
+            return self.memo[key]
+
+        kind = type(node)
+
+        if kind is BinOp:
+            op = BINARY_OPS.get(node.op.type)
+            if op is None:
+                raise Exception("Unknown operator found")
+            value = op(self.evaluate(node.left), self.evaluate(node.right))
+        elif kind is IntNode:
+            return node.value
+        elif kind is Var:
+            value = self.scope.get(node.value.lower(), None)
+            if value is None:
+                raise NameError(str(node.value))
+            return value
+        elif kind is UnaryOp:
+            if node.op.type == PLUS:
+                value = +self.evaluate(node.expr)
+            else:
+                value = -self.evaluate(node.expr)
+        else:
+            raise Exception("Invalid AST for input expression")
+
+        if key in self.shared:
+            self.memo[key] = value
+            for name in self.deps[key]:
+                self.watch.setdefault(name, []).append(key)
+
+        return value
+
+
+def build_dag(ast):
+    '''
+    Optional CSE pass; RETURN: ExpressionDAG for the program
+    '''
+    return ExpressionDAG(ast)
@@ -0,0 +1,140 @@
+'''
+Vectorised evaluation of eval_pascal programs with NumPy
+
+Chosen variables are bound to 1-D integer arrays holding one
+starting value per run, and the compiled program evaluates
+every BinOp/UnaryOp elementwise across the whole batch in a
+single pass. Results come back as one column per variable
+
+Values are int64, so intermediate results must fit in 64 bits
+(the interpreter itself promotes to long instead)
+
+usage: python pascal_numpy.py program.pas name=1,2,3 [name=...]
+
+Author: GotoCode
+'''
+
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from eval_pascal import (PLUS, MINUS, MULTIPLY, DIVIDE,
+                         Interpreter, compile_node, load_source, resolve_slots)
+
+
+DTYPE = 'int64'
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError('Vectorised evaluation requires NumPy')
+
+def divide(left, right):
+    '''
+    Integer div with the interpreter's semantics: floor
+    division, and an error (not a zero) on division by zero
+    '''
+    if not numpy.all(right):
+        raise ZeroDivisionError('integer division or modulo by zero')
+
+    return numpy.floor_divide(left, right)
+
+
+if numpy is not None:
+    VECTOR_OPS = {PLUS     : numpy.add,
+                  MINUS    : numpy.subtract,
+                  MULTIPLY : numpy.multiply,
+                  DIVIDE   : divide}
+else:
+    VECTOR_OPS = {}
+
+
+def compile_vector(ast):
+    '''
+    Turn a resolved AST node into a closure over a slot list
+    holding arrays (bound or computed) or plain integers
+    '''
+    require_numpy()
+
+    return compile_node(ast, VECTOR_OPS, numpy.negative)
+
+
+class VectorProgram(object):
+    '''
+    A program compiled for batch runs; run() may be called
+    any number of times with different bindings
+    '''
+    def __init__(self, ast):
+        require_numpy()
+        self.symbols = resolve_slots(ast)
+        self.code    = compile_vector(ast)
+
+    def run(self, bindings):
+        '''
+        Execute once per row of the bound arrays
+
+        bindings maps variable names to sequences of starting
+        values (all the same length) or to single integers
+
+        RETURN: name -> array with one entry per run, for every
+                variable that is bound or assigned
+        '''
+        slots = self.symbols.new_slots()
+        size  = None
+
+        for name, values in bindings.iteritems():
+            values = numpy.asarray(values, dtype=DTYPE)
+            if values.ndim > 1:
+                raise ValueError('Binding for %s is not one-dimensional' % name)
+            if values.ndim == 1:
+                if size is not None and len(values) != size:
+                    raise ValueError('Bindings have different lengths')
+                size = len(values)
+            slot = self.symbols.slots.get(name.lower())
+            # variables the program never mentions are ignored
+            if slot is not None:
+                slots[slot] = values
+
+        if size is None:
+            size = 1
+
+        self.code(slots)
+
+        columns = {}
+        for name, value in zip(self.symbols.names, slots):
+            if value is not None:
+                columns[name] = numpy.array(numpy.broadcast_to(value, (size,)))
+
+        return columns
+
+
+def eval_vector(ast, bindings):
+    '''
+    Compile and run ast over bindings; RETURN: name -> column
+    '''
+    return VectorProgram(ast).run(bindings)
+
+
+def main():
+    '''
+    Run a Pascal file over comma separated starting values
+    and print one column per variable
+    '''
+    program  = VectorProgram(Interpreter(load_source(sys.argv[1])).program())
+    bindings = {}
+
+    for arg in sys.argv[2:]:
+        name, values = arg.split('=', 1)
+        bindings[name] = [int(value) for value in values.split(',')]
+
+    columns = program.run(bindings)
+
+    for name in sorted(columns):
+        print name, columns[name].tolist()
+
+
+if __name__ == '__main__':
+    main()
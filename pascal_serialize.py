@@ -0,0 +1,338 @@
+'''
+Compact, versioned binary encoding for eval_pascal ASTs
+
+Layout:
+
+    MAGIC VERSION
+    constant pool : count, zigzag varint per integer
+    name pool     : count, (length, bytes) per name
+    node count, then one opcode byte per node in preorder,
+    followed by a varint pool index (IntNode / Var) or a
+    child count (CompoundNode), then the source position of
+    IntNode, Var, UnaryOp and CompoundNode nodes relative to
+    the previous position written: on the same line, one
+    varint holding the zigzag column delta shifted left by
+    one; otherwise a varint holding the zigzag line delta
+    shifted left with the low bit set, then the column (0
+    stands for an unknown line or column). BinOp and Assign
+    take their left operand's position, as their
+    constructors do
+
+Both directions use explicit stacks, so arbitrarily deep
+trees can be encoded and loaded
+
+Author: GotoCode
+'''
+
+from eval_pascal import (Token, BinOp, IntNode, UnaryOp, CompoundNode, Assign, Var, NoOp,
+                         INTEGER, ID, PLUS, MINUS, MULTIPLY, DIVIDE, ASSIGN,
+                         FIXED_TOKENS, UNARY_TOKENS)
+
+
+MAGIC   = 'PAST'
+VERSION = 3
+
+# Opcodes
+
+OP_INT      = 0
+OP_VAR      = 1
+OP_ADD      = 2
+OP_SUB      = 3
+OP_MUL      = 4
+OP_DIV      = 5
+OP_POS      = 6
+OP_NEG      = 7
+OP_ASSIGN   = 8
+OP_COMPOUND = 9
+OP_NOOP     = 10
+
+BINARY_OPCODES = {PLUS     : OP_ADD,
+                  MINUS    : OP_SUB,
+                  MULTIPLY : OP_MUL,
+                  DIVIDE   : OP_DIV}
+
+# opcode -> operator token restored on load
+OPCODE_TOKENS = {OP_ADD : FIXED_TOKENS[PLUS],
+                 OP_SUB : FIXED_TOKENS[MINUS],
+                 OP_MUL : FIXED_TOKENS[MULTIPLY],
+                 OP_DIV : FIXED_TOKENS[DIVIDE],
+                 OP_POS : UNARY_TOKENS[PLUS],
+                 OP_NEG : UNARY_TOKENS[MINUS]}
+
+
+def write_varint(out, n):
+    '''
+    Append unsigned n to the bytearray out, 7 bits per byte
+    '''
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def read_varint(data, pos):
+    '''
+    RETURN: (value, position after it)
+    '''
+    result = 0
+    shift  = 0
+
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def write_position(out, node, last_line, last_column):
+    '''
+    Append the source position of node relative to the last
+    one written (0 stands for an unknown line or column)
+
+    RETURN: (line, column) of node
+    '''
+    line   = node.line or 0
+    column = node.column or 0
+
+    if line == last_line:
+        # low bit clear: same line, column delta follows
+        write_varint(out, zigzag(column - last_column) << 1)
+    else:
+        write_varint(out, zigzag(line - last_line) << 1 | 1)
+        write_varint(out, column)
+
+    return line, column
+
+def read_position(data, pos, last_line, last_column):
+    '''
+    RETURN: (line, column, position after them)
+    '''
+    head = data[pos]
+
+    # a nearby node on the same line is the common case
+    if head < 0x80 and not head & 1:
+        return last_line, last_column + unzigzag(head >> 1), pos + 1
+
+    head, pos = read_varint(data, pos)
+
+    if not head & 1:
+        return last_line, last_column + unzigzag(head >> 1), pos
+
+    column, pos = read_varint(data, pos)
+
+    return last_line + unzigzag(head >> 1), column, pos
+
+def zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def unzigzag(z):
+    return z >> 1 if not z & 1 else -(z >> 1) - 1
+
+
+# Encoder #
+
+def dumps(ast):
+    '''
+    RETURN: str holding the binary encoding of ast
+    '''
+    consts      = []
+    const_index = {}
+    names       = []
+    name_index  = {}
+    code        = bytearray()
+    count       = 0
+    # last position written
+    last_line   = 0
+    last_column = 0
+    stack       = [ast]
+
+    while stack:
+
+        node  = stack.pop()
+        kind  = type(node)
+        count += 1
+
+        if kind is BinOp:
+            if node.op.type not in BINARY_OPCODES:
+                raise Exception("Unknown operator found")
+            code.append(BINARY_OPCODES[node.op.type])
+            stack.append(node.right)
+            stack.append(node.left)
+        elif kind is IntNode:
+            index = const_index.get(node.value)
+            if index is None:
+                index = const_index[node.value] = len(consts)
+                consts.append(node.value)
+            code.append(OP_INT)
+            write_varint(code, index)
+            last_line, last_column = write_position(code, node, last_line, last_column)
+        elif kind is Var:
+            index = name_index.get(node.value)
+            if index is None:
+                index = name_index[node.value] = len(names)
+                names.append(node.value)
+            code.append(OP_VAR)
+            write_varint(code, index)
+            last_line, last_column = write_position(code, node, last_line, last_column)
+        elif kind is UnaryOp:
+            code.append(OP_POS if node.op.type == PLUS else OP_NEG)
+            last_line, last_column = write_position(code, node, last_line, last_column)
+            stack.append(node.expr)
+        elif kind is Assign:
+            code.append(OP_ASSIGN)
+            stack.append(node.right)
+            stack.append(node.left)
+        elif kind is CompoundNode:
+            code.append(OP_COMPOUND)
+            write_varint(code, len(node.children))
+            last_line, last_column = write_position(code, node, last_line, last_column)
+            stack.extend(reversed(node.children))
+        elif kind is NoOp:
+            code.append(OP_NOOP)
+        else:
+            raise Exception("Invalid AST for input expression")
+
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+
+    write_varint(out, len(consts))
+    for value in consts:
+        write_varint(out, zigzag(value))
+
+    write_varint(out, len(names))
+    for name in names:
+        write_varint(out, len(name))
+        out.extend(name)
+
+    write_varint(out, count)
+    out.extend(code)
+
+    return str(out)
+
+
+# Loader #
+
+def loads(data):
+    '''
+    Rebuild an AST from the output of dumps
+
+    Malformed or truncated data raises ValueError
+    '''
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a serialised AST')
+
+    try:
+        return read_tree(bytearray(data))
+    except IndexError:
+        raise ValueError('Truncated AST data')
+
+def read_tree(data):
+    '''
+    Decode everything after the magic; reading past the end
+    of data raises IndexError
+    '''
+    pos = len(MAGIC)
+
+    if data[pos] != VERSION:
+        raise ValueError('Unsupported AST format version %d' % data[pos])
+    pos += 1
+
+    count, pos = read_varint(data, pos)
+    consts = []
+    for _ in xrange(count):
+        value, pos = read_varint(data, pos)
+        consts.append(unzigzag(value))
+
+    count, pos = read_varint(data, pos)
+    names = []
+    for _ in xrange(count):
+        length, pos = read_varint(data, pos)
+        if pos + length > len(data):
+            raise IndexError(pos + length)
+        names.append(intern(str(data[pos:pos + length])))
+        pos += length
+
+    count, pos = read_varint(data, pos)
+
+    # frames of nodes still waiting for children:
+    # [opcode, arity, children, line, column] (line 0 for
+    # BinOp and Assign, whose constructors set the position)
+    stack  = []
+    tokens = OPCODE_TOKENS
+    root   = None
+    # last position read
+    line   = 0
+    column = 0
+
+    for _ in xrange(count):
+
+        op   = data[pos]
+        pos += 1
+
+        if op == OP_INT:
+            # one-byte indices are the common case
+            index = data[pos]
+            if index < 0x80:
+                pos += 1
+            else:
+                index, pos = read_varint(data, pos)
+            node = IntNode(Token(INTEGER, consts[index]))
+            line, column, pos = read_position(data, pos, line, column)
+        elif op == OP_VAR:
+            index = data[pos]
+            if index < 0x80:
+                pos += 1
+            else:
+                index, pos = read_varint(data, pos)
+            node = Var(Token(ID, names[index]))
+            line, column, pos = read_position(data, pos, line, column)
+        elif op == OP_NOOP:
+            node = NoOp()
+        elif OP_ADD <= op <= OP_DIV or op == OP_ASSIGN:
+            stack.append([op, 2, [], 0, 0])
+            continue
+        elif op in (OP_POS, OP_NEG):
+            line, column, pos = read_position(data, pos, line, column)
+            stack.append([op, 1, [], line, column])
+            continue
+        elif op == OP_COMPOUND:
+            arity, pos = read_varint(data, pos)
+            line, column, pos = read_position(data, pos, line, column)
+            if arity:
+                stack.append([op, arity, [], line, column])
+                continue
+            node = CompoundNode()
+        else:
+            raise ValueError('Unknown AST opcode %d' % op)
+
+        if line and op != OP_NOOP:
+            node.line, node.column = line, column
+
+        # hand the finished node to its parent, completing
+        # every parent that now has all of its children
+        while stack:
+            frame    = stack[-1]
+            children = frame[2]
+            children.append(node)
+            if len(children) < frame[1]:
+                break
+            stack.pop()
+            op = frame[0]
+            if op == OP_ASSIGN:
+                node = Assign(children[0], FIXED_TOKENS[ASSIGN], children[1])
+            elif op == OP_COMPOUND:
+                node = CompoundNode()
+                node.children = children
+            elif frame[1] == 1:
+                node = UnaryOp(tokens[op], children[0])
+            else:
+                node = BinOp(children[0], tokens[op], children[1])
+            if frame[3]:
+                node.line, node.column = frame[3], frame[4]
+        else:
+            root = node
+
+    if stack or root is None:
+        raise ValueError('Truncated AST data')
+
+    return root
@@ -0,0 +1,215 @@
+'''
+A stack-based bytecode VM for eval_pascal programs
+
+Programs are compiled into a flat array of (opcode, arg)
+pairs and run by a single dispatch loop over a value stack
+
+usage: python pascal_vm.py [-d] program.pas
+
+Author: GotoCode
+'''
+
+import sys
+from array import array
+
+from eval_pascal import (BinOp, IntNode, UnaryOp, CompoundNode, Assign, Var, NoOp,
+                         PLUS, MINUS, MULTIPLY, DIVIDE, GLOBAL_SCOPE,
+                         Interpreter, load_source, resolve_slots)
+
+
+# Opcodes
+
+LOAD_CONST = 0
+LOAD_SLOT  = 1
+STORE_SLOT = 2
+ADD        = 3
+SUB        = 4
+MUL        = 5
+DIV        = 6
+NEG        = 7
+
+OPNAMES = ('LOAD_CONST', 'LOAD_SLOT', 'STORE_SLOT',
+           'ADD', 'SUB', 'MUL', 'DIV', 'NEG')
+
+BINARY_OPCODES = {PLUS     : ADD,
+                  MINUS    : SUB,
+                  MULTIPLY : MUL,
+                  DIVIDE   : DIV}
+
+
+class CodeObject(object):
+    '''
+    Compiled program: code buffer, constant pool and
+    the symbol table giving each slot its name
+    '''
+    def __init__(self, symbols):
+        self.code    = array('i')
+        self.consts  = []
+        self.symbols = symbols
+        # constant value -> index into consts
+        self.const_index = {}
+
+    def emit(self, opcode, arg=0):
+        self.code.append(opcode)
+        self.code.append(arg)
+
+    def const(self, value):
+        index = self.const_index.get(value)
+
+        if index is None:
+            index = len(self.consts)
+            self.consts.append(value)
+            self.const_index[value] = index
+
+        return index
+
+    def __len__(self):
+        '''Number of instructions'''
+        return len(self.code) // 2
+
+
+# Compiler #
+
+def compile_program(ast):
+    '''
+    Compile a parsed program into a CodeObject
+    '''
+    program = CodeObject(resolve_slots(ast))
+    compile_node(ast, program)
+
+    return program
+
+def compile_node(ast, program):
+
+    if isinstance(ast, BinOp):
+        if ast.op.type not in BINARY_OPCODES:
+            raise Exception("Unknown operator found")
+        compile_node(ast.left, program)
+        compile_node(ast.right, program)
+        program.emit(BINARY_OPCODES[ast.op.type])
+    elif isinstance(ast, Var):
+        program.emit(LOAD_SLOT, ast.slot)
+    elif isinstance(ast, IntNode):
+        program.emit(LOAD_CONST, program.const(ast.value))
+    elif isinstance(ast, UnaryOp):
+        compile_node(ast.expr, program)
+        # unary plus leaves an integer unchanged
+        if ast.op.type == MINUS:
+            program.emit(NEG)
+    elif isinstance(ast, Assign):
+        compile_node(ast.right, program)
+        program.emit(STORE_SLOT, ast.left.slot)
+    elif isinstance(ast, CompoundNode):
+        for child in ast.children:
+            compile_node(child, program)
+    elif isinstance(ast, NoOp):
+        pass
+    else:
+        raise Exception("Invalid AST for input expression")
+
+
+# Virtual machine #
+
+def execute(program, slots=None):
+    '''
+    Run a CodeObject; RETURN: the slot list after execution
+    '''
+    if slots is None:
+        slots = program.symbols.new_slots()
+
+    code   = program.code
+    consts = program.consts
+    names  = program.symbols.names
+    stack  = []
+    push   = stack.append
+    pop    = stack.pop
+    pc     = 0
+    end    = len(code)
+
+    while pc < end:
+
+        op  = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        if op == LOAD_SLOT:
+            value = slots[arg]
+            if value is None:
+                raise NameError(names[arg])
+            push(value)
+        elif op == LOAD_CONST:
+            push(consts[arg])
+        elif op == STORE_SLOT:
+            slots[arg] = pop()
+        elif op == ADD:
+            right = pop()
+            stack[-1] = stack[-1] + right
+        elif op == SUB:
+            right = pop()
+            stack[-1] = stack[-1] - right
+        elif op == MUL:
+            right = pop()
+            stack[-1] = stack[-1] * right
+        elif op == DIV:
+            right = pop()
+            stack[-1] = stack[-1] / right
+        elif op == NEG:
+            stack[-1] = -stack[-1]
+        else:
+            raise Exception('Unknown opcode %d' % op)
+
+    return slots
+
+def run(program, scope=None):
+    '''
+    Execute on fresh slots; RETURN: name -> value dict
+    '''
+    return program.symbols.export(execute(program), scope)
+
+
+# Disassembler #
+
+def disassemble(program):
+    '''
+    RETURN: list of human readable instruction lines
+    '''
+    lines = []
+    code  = program.code
+
+    for pc in range(0, len(code), 2):
+        op, arg = code[pc], code[pc + 1]
+
+        if op == LOAD_CONST:
+            detail = '%d (%r)' % (arg, program.consts[arg])
+        elif op in (LOAD_SLOT, STORE_SLOT):
+            detail = '%d (%s)' % (arg, program.symbols.names[arg])
+        else:
+            detail = ''
+
+        lines.append(('%6d %-12s %s' % (pc // 2, OPNAMES[op], detail)).rstrip())
+
+    return lines
+
+
+def main():
+    '''
+    Compile and run (or with -d, disassemble) a Pascal file
+    '''
+    args = sys.argv[1:]
+    show = '-d' in args
+
+    if show:
+        args.remove('-d')
+
+    program = compile_program(Interpreter(load_source(args[0])).program())
+
+    if show:
+        print '\n'.join(disassemble(program))
+    else:
+        GLOBAL_SCOPE.clear()
+        run(program, GLOBAL_SCOPE)
+        print GLOBAL_SCOPE
+
+
+if __name__ == '__main__':
+    main()
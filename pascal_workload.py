@@ -0,0 +1,288 @@
+'''
+Seeded synthetic workload generator for eval_pascal
+
+Emits programs with nested BEGIN ... END blocks, := assignments,
+div, unary signs and variable reuse at a controlled size. The
+same parameters and seed always give the same program, so a
+scaling measurement can be reproduced exactly
+
+Values are tracked while generating, which keeps every program
+valid: variables are read only after they are assigned, no
+divisor is ever zero and no variable grows past VALUE_LIMIT
+
+usage: python pascal_workload.py [-n STATEMENTS] [-d DEPTH] [-v VARIABLES]
+                                 [-r REUSE] [-b BLOCKS] [-s SEED]
+                                 [-o FILE.pas | --run]
+
+Author: GotoCode
+'''
+
+import mmap
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+DEFAULT_STATEMENTS = 1000
+DEFAULT_DEPTH      = 3
+DEFAULT_VARIABLES  = 26
+DEFAULT_REUSE      = 0.5
+DEFAULT_BLOCKS     = 0.05
+DEFAULT_NESTING    = 4
+
+# largest magnitude a variable may hold after an assignment
+VALUE_LIMIT = 10 ** 6
+
+# chance that an expression node is a leaf before the depth
+# is exhausted, that a leaf reads a variable and that a node
+# is a unary sign
+LEAF_PROBABILITY  = 0.3
+VAR_PROBABILITY   = 0.5
+UNARY_PROBABILITY = 0.15
+
+OPERATORS = ('+', '-', '*', 'div')
+
+INDENT = '    '
+
+
+def floor_div(left, right):
+    '''
+    div as the interpreter computes it (Python 2 integer /)
+    '''
+    return left // right
+
+def apply(op, left, right):
+
+    if op == '+':
+        return left + right
+    elif op == '-':
+        return left - right
+    elif op == '*':
+        return left * right
+    else:
+        return floor_div(left, right)
+
+
+class WorkloadGenerator(object):
+    '''
+    Generator for one program
+
+        statements  number of assignments
+        depth       maximum expression depth
+        variables   number of distinct variable names
+        reuse       chance an assignment overwrites an existing
+                    variable while fresh names remain
+        blocks      chance of opening (and of closing) a nested
+                    BEGIN ... END block at each statement
+        nesting     maximum block nesting depth
+
+    After lines() has been consumed, scope holds the value of
+    every variable the program assigns
+    '''
+    def __init__(self, statements=DEFAULT_STATEMENTS, depth=DEFAULT_DEPTH,
+                 variables=DEFAULT_VARIABLES, reuse=DEFAULT_REUSE,
+                 blocks=DEFAULT_BLOCKS, nesting=DEFAULT_NESTING, seed=0):
+        self.statements = statements
+        self.depth      = depth
+        self.variables  = max(variables, 1)
+        self.reuse      = reuse
+        self.blocks     = blocks
+        self.nesting    = nesting
+        self.seed       = seed
+        self.scope      = {}
+
+    def expression(self, depth):
+        '''
+        RETURN: (text, value, is_composite) of a random expression
+        '''
+        random = self.random
+
+        if depth <= 0 or random.random() < LEAF_PROBABILITY:
+            if self.defined and random.random() < VAR_PROBABILITY:
+                name = random.choice(self.defined)
+                return name, self.scope[name], False
+            value = random.randint(0, 99)
+            return str(value), value, False
+
+        if random.random() < UNARY_PROBABILITY:
+            text, value, composite = self.expression(depth - 1)
+            if composite:
+                text = '(%s)' % text
+            if random.random() < 0.5:
+                return '-' + text, -value, False
+            return '+' + text, value, False
+
+        op = random.choice(OPERATORS)
+        left, left_value, left_composite    = self.expression(depth - 1)
+        right, right_value, right_composite = self.expression(depth - 1)
+
+        if op == '*' and abs(left_value * right_value) > VALUE_LIMIT:
+            op = 'div'
+
+        if op == 'div' and right_value == 0:
+            right_value = random.randint(1, 9)
+            right, right_composite = str(right_value), False
+
+        # children are parenthesised, so the tree is the one generated
+        if left_composite:
+            left = '(%s)' % left
+        if right_composite:
+            right = '(%s)' % right
+
+        return '%s %s %s' % (left, op, right), apply(op, left_value, right_value), True
+
+    def target(self):
+        '''
+        RETURN: name of the variable the next statement assigns
+        '''
+        random = self.random
+        fresh  = len(self.defined) < self.variables
+
+        if fresh and (not self.defined or random.random() >= self.reuse):
+            name = 'v%d' % len(self.defined)
+            self.defined.append(name)
+            return name
+
+        return random.choice(self.defined)
+
+    def assignment(self):
+
+        text, value, composite = self.expression(self.depth)
+
+        if abs(value) > VALUE_LIMIT:
+            # scale back into range so later statements stay small
+            divisor = abs(value) // VALUE_LIMIT + 1
+            text    = '(%s) div %d' % (text, divisor) if composite else '%s div %d' % (text, divisor)
+            value   = floor_div(value, divisor)
+
+        name = self.target()
+        self.scope[name] = value
+
+        return '%s := %s' % (name, text)
+
+    def lines(self):
+        '''
+        YIELD: the program, one line (with newline) at a time
+        '''
+        self.random  = random.Random(self.seed)
+        self.defined = []
+        self.scope   = {}
+        chance       = self.random.random
+        # one flag per open block: has it a statement yet
+        filled       = [False]
+        # the last line is held back until we know whether
+        # it needs a ';' separator
+        pending      = 'BEGIN'
+
+        for _ in xrange(self.statements):
+
+            if len(filled) > 1 and chance() < self.blocks:
+                yield pending + '\n'
+                filled.pop()
+                pending = INDENT * len(filled) + 'END'
+
+            if len(filled) <= self.nesting and chance() < self.blocks:
+                yield pending + (';\n' if filled[-1] else '\n')
+                filled[-1] = True
+                pending = INDENT * len(filled) + 'BEGIN'
+                filled.append(False)
+
+            yield pending + (';\n' if filled[-1] else '\n')
+            filled[-1] = True
+            pending = INDENT * len(filled) + self.assignment()
+
+        yield pending + '\n'
+
+        while len(filled) > 1:
+            filled.pop()
+            yield INDENT * len(filled) + 'END\n'
+
+        yield 'END.\n'
+
+    def text(self):
+        return ''.join(self.lines())
+
+    def write(self, path):
+        '''
+        Write the program to path without holding it in memory
+        '''
+        with open(path, 'w') as fp:
+            fp.writelines(self.lines())
+
+
+def generate_program(statements=DEFAULT_STATEMENTS, seed=0, **options):
+    '''
+    RETURN: source text of a generated program
+    '''
+    return WorkloadGenerator(statements, seed=seed, **options).text()
+
+
+def main():
+    '''
+    Write a generated program to a file or stdout, or with
+    --run spool it to a temporary file and run that memory-
+    mapped through the streaming interpreter
+    '''
+    args    = sys.argv[1:]
+    options = {}
+    path    = None
+    run     = False
+    flags   = {'-n' : ('statements', int),
+               '-d' : ('depth', int),
+               '-v' : ('variables', int),
+               '-r' : ('reuse', float),
+               '-b' : ('blocks', float),
+               '-s' : ('seed', int)}
+
+    while args:
+        arg = args.pop(0)
+        if arg in flags:
+            name, kind = flags[arg]
+            options[name] = kind(args.pop(0))
+        elif arg == '-o':
+            path = args.pop(0)
+        elif arg == '--run':
+            run = True
+        else:
+            print >> sys.stderr, __doc__
+            sys.exit(2)
+
+    generator = WorkloadGenerator(**options)
+
+    if run:
+        from eval_pascal import GLOBAL_SCOPE, Interpreter, load_source
+
+        # the program is never held in memory as one string
+        fd, source_path = tempfile.mkstemp(suffix='.pas')
+        os.close(fd)
+
+        try:
+            generator.write(source_path)
+            text = load_source(source_path)
+            size = len(text)
+            try:
+                start = time.time()
+                GLOBAL_SCOPE.clear()
+                Interpreter(text).eval_streaming()
+                elapsed = time.time() - start
+            finally:
+                if isinstance(text, mmap.mmap):
+                    text.close()
+        finally:
+            os.remove(source_path)
+
+        print >> sys.stderr, '%d statements, %d bytes in %.3fs (%.0f statements/s)' % (
+            generator.statements, size, elapsed, generator.statements / elapsed if elapsed else 0)
+        if GLOBAL_SCOPE != generator.scope:
+            print >> sys.stderr, 'MISMATCH against generated values'
+            sys.exit(1)
+    elif path is not None:
+        generator.write(path)
+    else:
+        sys.stdout.writelines(generator.lines())
+
+
+if __name__ == '__main__':
+    main()